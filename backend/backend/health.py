@@ -33,8 +33,8 @@ def health_check(request):
     
     # Check Elasticsearch (optional, don't fail if not available)
     try:
-        from elasticsearch import Elasticsearch
-        es = Elasticsearch([settings.ES_HOST])
+        from core.es_client import get_es_client
+        es = get_es_client().options(request_timeout=settings.ES_HEALTH_TIMEOUT, max_retries=0)
         if es.ping():
             health_status['checks']['elasticsearch'] = 'healthy'
         else:
@@ -93,6 +93,21 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Redis shares state such as search index generations between processes
+
+REDIS_URL = os.getenv('REDIS_URL', '')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -171,6 +186,22 @@ REST_FRAMEWORK = {
 ES_HOST = os.getenv('ES_HOST', 'http://localhost:9200')
 ES_INDEX_NEWS = os.getenv('ES_INDEX_NEWS', 'news_articles')
 ES_INDEX_DOCS = os.getenv('ES_INDEX_DOCS', 'documents')
+ES_INDEX_SEARCH_NEWS = os.getenv('ES_INDEX_SEARCH_NEWS', 'news')  # News search endpoint (search app)
+
+# Shared client (core.es_client): connection pool, timeouts and retries
+ES_CONNECTIONS_PER_NODE = int(os.getenv('ES_CONNECTIONS_PER_NODE', '25'))  # Keep-alive connections per node
+ES_REQUEST_TIMEOUT = float(os.getenv('ES_REQUEST_TIMEOUT', '10'))  # Seconds, per request
+ES_MAX_RETRIES = int(os.getenv('ES_MAX_RETRIES', '3'))
+ES_RETRY_ON_TIMEOUT = os.getenv('ES_RETRY_ON_TIMEOUT', 'True') == 'True'
+ES_SNIFF = os.getenv('ES_SNIFF', 'False') == 'True'  # Discover cluster nodes; leave off behind a load balancer
+ES_SNIFF_INTERVAL = float(os.getenv('ES_SNIFF_INTERVAL', '60'))  # Seconds between sniffs
+ES_HEALTH_TIMEOUT = float(os.getenv('ES_HEALTH_TIMEOUT', '2'))  # Seconds, health check ping
+
+# Vector store for kNN retrieval: 'elasticsearch', 'milvus' or 'local' (memory-mapped, in-process)
+VECTOR_STORE_BACKEND = os.getenv('VECTOR_STORE_BACKEND', 'elasticsearch')
+VECTOR_STORE_LOCAL_DIR = os.getenv('VECTOR_STORE_LOCAL_DIR', str(BASE_DIR / 'cache' / 'vectors'))
+MILVUS_HOST = os.getenv('MILVUS_HOST', '127.0.0.1')
+MILVUS_PORT = os.getenv('MILVUS_PORT', '19530')
 
 # OpenAI Configuration
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY', '')
@@ -179,6 +210,62 @@ OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-3.5-turbo')
 # Embeddings Configuration
 EMBEDDING_MODEL = os.getenv('EMBEDDING_MODEL', 'sentence-transformers/all-MiniLM-L6-v2')
 EMBEDDING_DIMENSION = int(os.getenv('EMBEDDING_DIMENSION', '384'))
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'torch')  # 'torch' or 'onnx'
+EMBEDDING_ONNX_FILE = os.getenv('EMBEDDING_ONNX_FILE', '')  # e.g. 'onnx/model_qint8_avx512_vnni.onnx' for int8
+
+# Ingestion chunking: articles are indexed as overlapping windows of whole sentences
+INGEST_CHUNK_WORDS = int(os.getenv('INGEST_CHUNK_WORDS', '150'))  # Fits the embedding model's 256 token limit
+INGEST_CHUNK_OVERLAP_WORDS = int(os.getenv('INGEST_CHUNK_OVERLAP_WORDS', '30'))
+
+# Embedding cache: in-process LRU plus a memory-mapped store on disk
+EMBEDDING_CACHE_ENABLED = os.getenv('EMBEDDING_CACHE_ENABLED', 'True') == 'True'
+EMBEDDING_CACHE_SIZE = int(os.getenv('EMBEDDING_CACHE_SIZE', '10000'))  # In-memory entries
+EMBEDDING_CACHE_DIR = os.getenv('EMBEDDING_CACHE_DIR', str(BASE_DIR / 'cache' / 'embeddings'))  # Empty disables the disk tier
+EMBEDDING_CACHE_DISK_CAPACITY = int(os.getenv('EMBEDDING_CACHE_DISK_CAPACITY', '200000'))  # Rows on disk
+
+# Embedding server: one shared model process, batching requests from all workers
+EMBEDDING_SERVER_SOCKET = os.getenv('EMBEDDING_SERVER_SOCKET', '')  # Empty encodes in-process
+EMBEDDING_SERVER_MAX_BATCH_SIZE = int(os.getenv('EMBEDDING_SERVER_MAX_BATCH_SIZE', '64'))
+EMBEDDING_SERVER_MAX_WAIT_MS = int(os.getenv('EMBEDDING_SERVER_MAX_WAIT_MS', '5'))
+EMBEDDING_SERVER_TIMEOUT = int(os.getenv('EMBEDDING_SERVER_TIMEOUT', '30'))  # Seconds
+
+# Search result cache: per-process, invalidated whenever an index is written
+# On by default only with Redis: other processes' writes can't invalidate a per-process cache
+SEARCH_CACHE_ENABLED = os.getenv('SEARCH_CACHE_ENABLED', str(bool(REDIS_URL))) == 'True'
+SEARCH_CACHE_SIZE = int(os.getenv('SEARCH_CACHE_SIZE', '1000'))  # Entries per process
+SEARCH_CACHE_TTL = int(os.getenv('SEARCH_CACHE_TTL', '60'))  # Seconds
+
+# News search pagination: search_after over a point-in-time snapshot
+SEARCH_PAGE_SIZE = int(os.getenv('SEARCH_PAGE_SIZE', '20'))
+SEARCH_MAX_PAGE_SIZE = int(os.getenv('SEARCH_MAX_PAGE_SIZE', '100'))
+SEARCH_PIT_KEEP_ALIVE = os.getenv('SEARCH_PIT_KEEP_ALIVE', '2m')  # Renewed on every page
+SEARCH_FACET_SIZE = int(os.getenv('SEARCH_FACET_SIZE', '20'))  # Values returned per terms facet
+
+# News title suggestions (search-as-you-type)
+SEARCH_SUGGEST_SIZE = int(os.getenv('SEARCH_SUGGEST_SIZE', '5'))
+SEARCH_SUGGEST_MAX_SIZE = int(os.getenv('SEARCH_SUGGEST_MAX_SIZE', '10'))
+SEARCH_SUGGEST_MIN_CHARS = int(os.getenv('SEARCH_SUGGEST_MIN_CHARS', '2'))
+SEARCH_SUGGEST_BUDGET_MS = int(os.getenv('SEARCH_SUGGEST_BUDGET_MS', '150'))  # Hard limit per request
+
+# Copilot retrieval: 'hybrid' fuses BM25 and kNN with reciprocal rank fusion
+COPILOT_RETRIEVAL_MODE = os.getenv('COPILOT_RETRIEVAL_MODE', 'hybrid')  # 'hybrid' or 'vector'
+
+# Copilot re-ranking: over-fetch candidates and re-score them with a local cross-encoder
+COPILOT_RERANK_ENABLED = os.getenv('COPILOT_RERANK_ENABLED', 'False') == 'True'
+COPILOT_RERANK_MODEL = os.getenv('COPILOT_RERANK_MODEL', 'cross-encoder/ms-marco-MiniLM-L-6-v2')
+COPILOT_RERANK_CANDIDATES = int(os.getenv('COPILOT_RERANK_CANDIDATES', '50'))
+COPILOT_RERANK_BATCH_SIZE = int(os.getenv('COPILOT_RERANK_BATCH_SIZE', '16'))
+COPILOT_RERANK_BUDGET_MS = int(os.getenv('COPILOT_RERANK_BUDGET_MS', '150'))  # Falls back to retrieval order when exceeded
+
+# Copilot prompt budget, counted with tiktoken (or estimated at 4 characters per token)
+COPILOT_PROMPT_TOKEN_BUDGET = int(os.getenv('COPILOT_PROMPT_TOKEN_BUDGET', '3000'))  # System prompt, history, documents and question
+COPILOT_HISTORY_TOKEN_BUDGET = int(os.getenv('COPILOT_HISTORY_TOKEN_BUDGET', '800'))  # Share of the prompt budget for chat history
+
+# Copilot answer cache: reuses answers for near-identical questions
+COPILOT_ANSWER_CACHE_ENABLED = os.getenv('COPILOT_ANSWER_CACHE_ENABLED', 'True') == 'True'
+COPILOT_ANSWER_CACHE_SIZE = int(os.getenv('COPILOT_ANSWER_CACHE_SIZE', '1000'))  # Entries per process
+COPILOT_ANSWER_CACHE_TTL = int(os.getenv('COPILOT_ANSWER_CACHE_TTL', '3600'))  # Seconds
+COPILOT_ANSWER_CACHE_THRESHOLD = float(os.getenv('COPILOT_ANSWER_CACHE_THRESHOLD', '0.95'))  # Minimum cosine similarity
 
 # n8n Configuration
 N8N_WEBHOOK_SECRET = os.getenv('N8N_WEBHOOK_SECRET', '')
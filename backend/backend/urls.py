@@ -15,6 +15,7 @@ urlpatterns = [
     path('api/v1/sources/', include('sources.urls')),
     path('api/v1/dashboard/', include('dashboard.urls')),
     path('api/v1/scenarios/', include('scenarios.urls')),
+    path('api/v1/search/', include('search.urls')),
 ]
 
 # Serve media files in development
@@ -0,0 +1,147 @@
+"""
+Semantic cache of copilot answers
+"""
+
+from collections import OrderedDict
+from sources.elasticsearch_service import parent_key
+import itertools
+import threading
+import time
+import numpy as np
+
+
+class _CachedAnswer:
+    def __init__(self, scope, embedding, doc_ids, result, expires_at):
+        self.scope = scope
+        self.embedding = embedding
+        self.doc_ids = doc_ids
+        self.result = result
+        self.expires_at = expires_at
+
+
+class SemanticAnswerCache:
+    """
+    Reuses answers for near-identical questions
+
+    An entry matches when the new query's embedding has cosine similarity
+    of at least `threshold` with the cached one and retrieval returned the
+    same set of documents. Entries are scoped per user and context,
+    expire after `ttl` seconds and are evicted least-recently-used once
+    `max_entries` is reached.
+    """
+
+    def __init__(self, max_entries=1000, ttl=3600, threshold=0.95):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries = OrderedDict()
+        self._scopes = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @staticmethod
+    def doc_ids(docs):
+        """
+        Identity of a retrieval result, independent of ranking
+        
+        Keyed on the parent article, like collapse_to_parents(), so a
+        different chunk of the same article still matches.
+        """
+        return frozenset(parent_key(doc) for doc in docs)
+
+    def get(self, scope, embedding, doc_ids):
+        """
+        Return the cached result for a query, or None on a miss
+        """
+        query = self._normalize(embedding)
+        now = time.monotonic()
+
+        with self._lock:
+            self._expire(scope, now)
+            entry_ids = [
+                entry_id for entry_id in self._scopes.get(scope, ())
+                if self._entries[entry_id].doc_ids == doc_ids
+            ]
+
+            if entry_ids:
+                matrix = np.stack([self._entries[entry_id].embedding for entry_id in entry_ids])
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry_id = entry_ids[best]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return dict(self._entries[entry_id].result)
+
+            self.misses += 1
+            return None
+
+    def put(self, scope, embedding, doc_ids, result):
+        if self.max_entries <= 0:
+            return
+
+        entry = _CachedAnswer(
+            scope,
+            self._normalize(embedding),
+            doc_ids,
+            dict(result),
+            time.monotonic() + self.ttl
+        )
+
+        with self._lock:
+            entry_id = next(self._ids)
+            self._entries[entry_id] = entry
+            self._scopes.setdefault(scope, []).append(entry_id)
+
+            while len(self._entries) > self.max_entries:
+                oldest_id, oldest = self._entries.popitem(last=False)
+                self._discard(oldest_id, oldest.scope)
+                self.evictions += 1
+
+    def _expire(self, scope, now):
+        for entry_id in list(self._scopes.get(scope, ())):
+            if self._entries[entry_id].expires_at <= now:
+                del self._entries[entry_id]
+                self._discard(entry_id, scope)
+                self.expirations += 1
+
+    def _discard(self, entry_id, scope):
+        """
+        Remove an entry ID from its scope index
+        """
+        ids = self._scopes[scope]
+        ids.remove(entry_id)
+        if not ids:
+            del self._scopes[scope]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._scopes.clear()
+
+    def stats(self):
+        """
+        Hit/miss and eviction counters
+        """
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'entries': len(self._entries),
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+    def __len__(self):
+        return len(self._entries)
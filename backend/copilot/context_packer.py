@@ -0,0 +1,139 @@
+"""
+Token-budgeted packing of retrieved documents and chat history
+"""
+
+from functools import lru_cache
+from sources.chunking import split_sentences
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_OVERHEAD = 4  # Tokens added per chat message by the API format
+MIN_DOCUMENT_TOKENS = 32  # Smaller remainders are not worth a document
+
+
+@lru_cache(maxsize=None)
+def _get_encoding(model):
+    """
+    tiktoken encoding for a model, or None if unavailable
+
+    The encoding files are downloaded on first use, so this also returns
+    None when offline.
+    """
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding('cl100k_base')
+    except Exception as e:
+        logger.warning(f"tiktoken unavailable, estimating token counts: {str(e)}")
+        return None
+
+
+def get_token_counter(model):
+    """
+    Token counting function for a model
+
+    Falls back to estimating four characters per token.
+    """
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return lambda text: math.ceil(len(text) / 4)
+    return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+
+class ContextPacker:
+    """
+    Fits documents and history into a prompt token budget
+    """
+
+    def __init__(self, count_tokens):
+        self.count_tokens = count_tokens
+
+    def trim(self, text, budget):
+        """
+        Longest prefix of whole sentences within budget
+
+        A first sentence that alone exceeds the budget is cut at a word
+        boundary instead. Returns (text, tokens).
+        """
+        tokens = self.count_tokens(text)
+        if tokens <= budget:
+            return text, tokens
+
+        kept = []
+        used = 0
+        for sentence in split_sentences(text):
+            cost = self.count_tokens(sentence)
+            if used + cost > budget:
+                break
+            kept.append(sentence)
+            used += cost
+
+        if kept:
+            return ' '.join(kept), used
+
+        words = []
+        used = 0
+        for word in text.split():
+            cost = self.count_tokens(word)
+            if used + cost > budget:
+                break
+            words.append(word)
+            used += cost
+        return ' '.join(words), used
+
+    def pack_history(self, history, budget):
+        """
+        Most recent messages that fit the budget, in chronological order
+
+        The oldest message that only partly fits is trimmed.
+        """
+        packed = []
+        remaining = budget
+
+        for msg in reversed(history):
+            content = msg.get('content', '')
+            available = remaining - MESSAGE_OVERHEAD
+            if available <= 0:
+                break
+
+            text, tokens = self.trim(content, available)
+            if not text:
+                break
+            packed.append(dict(msg, content=text))
+            remaining -= tokens + MESSAGE_OVERHEAD
+            if text != content:
+                break
+
+        packed.reverse()
+        return packed, budget - remaining
+
+    def pack_documents(self, docs, budget):
+        """
+        Greedily fill the budget with documents in relevance order
+
+        Returns a list of (title, text, trimmed) tuples and the tokens used.
+        """
+        packed = []
+        remaining = budget
+
+        for i, doc in enumerate(docs, 1):
+            source = doc.get('_source', {})
+            title = source.get('title', 'Untitled')
+            text = source.get('text', source.get('content', ''))
+
+            header = self.count_tokens(f"[Document {i}]\nTitle: {title}\nContent: \n\n")
+            available = remaining - header
+            if available < MIN_DOCUMENT_TOKENS:
+                break
+
+            body, tokens = self.trim(text, available)
+            if not body:
+                break
+            packed.append((title, body, body != text))
+            remaining -= header + tokens
+
+        return packed, budget - remaining
@@ -2,27 +2,65 @@
 RAG (Retrieval-Augmented Generation) service using LangChain
 """
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
-from sources.elasticsearch_service import get_elasticsearch_service
+from core.loop_local import LoopLocal
+from sources.elasticsearch_service import collapse_to_parents, get_async_elasticsearch_service, get_elasticsearch_service
 from sources.embedding_service import get_embedding_service
+from sources.vector_store import get_vector_store
+from .answer_cache import SemanticAnswerCache
+from .context_packer import MESSAGE_OVERHEAD, ContextPacker, get_token_counter
+from .reranker import get_reranker
 import logging
 import openai
 
 logger = logging.getLogger(__name__)
 
+# Async OpenAI clients hold connections bound to their event loop
+_async_openai_clients = LoopLocal(
+    lambda: openai.AsyncOpenAI(api_key=settings.OPENAI_API_KEY),
+    aclose=lambda client: client.close()
+)
+
+
+def get_async_openai_client():
+    """
+    Get the async OpenAI client for the running event loop
+    """
+    return _async_openai_clients.get()
+
 
 class RAGService:
     """
     Service for RAG pipeline with LangChain
     """
     
+    FALLBACK_ANSWER = "I apologize, but I'm currently unable to process your request. Please try again later."
+    STREAM_ERROR_MESSAGE = "The answer could not be completed. Please try again."
+    TOP_K = 5  # Documents passed to the LLM
+    CHUNKS_PER_PARENT = 3  # Over-fetch factor so collapsed chunk hits still fill the size
+    
     def __init__(self):
         self.es_service = get_elasticsearch_service()
         self.embedding_service = get_embedding_service()
+        self.vector_store = get_vector_store()
         self.openai_model = settings.OPENAI_MODEL
+        self.retrieval_mode = settings.COPILOT_RETRIEVAL_MODE
+        self.reranker = get_reranker()
+        self.rerank_candidates = settings.COPILOT_RERANK_CANDIDATES
+        self.prompt_token_budget = settings.COPILOT_PROMPT_TOKEN_BUDGET
+        self.history_token_budget = settings.COPILOT_HISTORY_TOKEN_BUDGET
+        self.packer = ContextPacker(get_token_counter(self.openai_model))
         openai.api_key = settings.OPENAI_API_KEY
+        self.answer_cache = None
+        if settings.COPILOT_ANSWER_CACHE_ENABLED:
+            self.answer_cache = SemanticAnswerCache(
+                max_entries=settings.COPILOT_ANSWER_CACHE_SIZE,
+                ttl=settings.COPILOT_ANSWER_CACHE_TTL,
+                threshold=settings.COPILOT_ANSWER_CACHE_THRESHOLD
+            )
     
-    def query(self, user_query, context="", session_history=None):
+    def query(self, user_query, context="", session_history=None, user_id=None):
         """
         Process a query through the RAG pipeline
         
@@ -30,65 +68,276 @@ class RAGService:
             user_query: The user's question
             context: Additional context (optional)
             session_history: List of previous messages (optional)
+            user_id: Scopes the answer cache (optional)
         
         Returns:
             dict with answer, sources, confidence, model_version
         """
         try:
-            # Step 1: Generate query embedding
-            query_embedding = self.embedding_service.embed_text(user_query)
-            
-            # Step 2: Retrieve relevant documents from Elasticsearch
-            try:
-                docs = self.es_service.search_vector(
-                    settings.ES_INDEX_NEWS,
-                    query_embedding,
-                    size=5
-                )
-            except Exception as e:
-                logger.warning(f"Vector search failed, falling back to text search: {str(e)}")
-                docs = self.es_service.search_text(
-                    settings.ES_INDEX_NEWS,
-                    user_query,
-                    size=5
-                )
+            # Step 1-2: Embed the query and retrieve relevant documents
+            query_embedding, docs = self._retrieve(user_query)
             
-            # Step 3: Build context from retrieved documents
-            context_text = self._build_context(docs, context)
+            cached = self._get_cached_answer(query_embedding, docs, context, session_history, user_id)
+            if cached is not None:
+                return cached
             
-            # Step 4: Build conversation history
-            messages = self._build_messages(user_query, context_text, session_history)
+            # Step 3-4: Pack documents and history into the prompt budget
+            messages = self._build_prompt(user_query, docs, context, session_history)
             
             # Step 5: Query OpenAI
             response = self._query_openai(messages)
+            failed = response is None
             
             # Step 6: Format and return response
-            return {
-                'answer': response,
-                'sources': self._format_sources(docs),
-                'confidence': self._calculate_confidence(docs),
-                'model_version': self.openai_model
-            }
+            result = self._build_result(self.FALLBACK_ANSWER if failed else response, docs)
+            self._cache_answer(query_embedding, docs, context, session_history, user_id, result, failed=failed)
+            return result
+        
+        except Exception as e:
+            logger.error(f"RAG query error: {str(e)}")
+            raise
+    
+    async def aquery(self, user_query, context="", session_history=None, user_id=None):
+        """
+        Async variant of query() for ASGI views
+        
+        Retrieval and generation await the async Elasticsearch and OpenAI
+        clients, so a single process can serve many concurrent chats.
+        Embedding is CPU-bound and runs in a worker thread.
+        """
+        try:
+            query_embedding, docs = await self._aretrieve(user_query)
+            
+            cached = self._get_cached_answer(query_embedding, docs, context, session_history, user_id)
+            if cached is not None:
+                return cached
+            
+            messages = self._build_prompt(user_query, docs, context, session_history)
+            response = await self._aquery_openai(messages)
+            failed = response is None
+            
+            result = self._build_result(self.FALLBACK_ANSWER if failed else response, docs)
+            self._cache_answer(query_embedding, docs, context, session_history, user_id, result, failed=failed)
+            return result
         
         except Exception as e:
             logger.error(f"RAG query error: {str(e)}")
             raise
     
-    def _build_context(self, docs, additional_context=""):
+    async def astream_query(self, user_query, context="", session_history=None, user_id=None):
+        """
+        Stream the RAG pipeline as events
+        
+        Yields a 'sources' event as soon as retrieval finishes, then one
+        'token' event per generated chunk, then a 'done' event carrying
+        the same payload as query(). A cached answer is sent as a single
+        token. If generation fails, an 'error' event replaces 'done' and
+        the partial answer is neither cached nor returned.
+        """
+        query_embedding, docs = await self._aretrieve(user_query)
+        
+        yield {
+            'event': 'sources',
+            'data': {
+                'sources': self._format_sources(docs),
+                'confidence': self._calculate_confidence(docs)
+            }
+        }
+        
+        cached = self._get_cached_answer(query_embedding, docs, context, session_history, user_id)
+        if cached is not None:
+            yield {'event': 'token', 'data': {'content': cached['answer']}}
+            yield {'event': 'done', 'data': cached}
+            return
+        
+        messages = self._build_prompt(user_query, docs, context, session_history)
+        
+        answer_parts = []
+        try:
+            async for token in self._astream_openai(messages):
+                answer_parts.append(token)
+                yield {'event': 'token', 'data': {'content': token}}
+        except Exception:
+            yield {'event': 'error', 'data': {'message': self.STREAM_ERROR_MESSAGE}}
+            return
+        
+        result = self._build_result(''.join(answer_parts), docs)
+        self._cache_answer(query_embedding, docs, context, session_history, user_id, result)
+        yield {'event': 'done', 'data': result}
+    
+    def _retrieve(self, user_query):
+        """
+        Embed a query and retrieve documents, returning (embedding, docs)
+        
+        kNN runs against the configured vector store, BM25 against
+        Elasticsearch. Hybrid mode fuses both; vector mode falls back to BM25.
+        Chunk hits are collapsed so each parent article appears once.
+        With re-ranking enabled, more candidates are fetched and only the
+        best TOP_K after re-ranking are kept.
+        """
+        query_embedding = self.embedding_service.embed_text_array(user_query)
+        size = self.rerank_candidates if self.reranker is not None else self.TOP_K
+        
+        if self.retrieval_mode == 'hybrid':
+            docs = self.es_service.hybrid_search(
+                settings.ES_INDEX_NEWS,
+                user_query,
+                query_embedding,
+                size=size,
+                vector_store=self.vector_store
+            )
+        else:
+            try:
+                docs = self.vector_store.search(
+                    query_embedding,
+                    size=size * self.CHUNKS_PER_PARENT
+                )
+            except Exception as e:
+                logger.warning(f"Vector search failed, falling back to text search: {str(e)}")
+                docs = self.es_service.search_text(
+                    settings.ES_INDEX_NEWS,
+                    user_query,
+                    size=size * self.CHUNKS_PER_PARENT
+                )
+            docs = collapse_to_parents(docs, size)
+        
+        if self.reranker is not None:
+            docs = self.reranker.rerank(user_query, docs, top_n=self.TOP_K)
+        
+        return query_embedding, docs
+    
+    async def _aretrieve(self, user_query):
+        """
+        Async variant of _retrieve()
+        """
+        embed = sync_to_async(self.embedding_service.embed_text_array, thread_sensitive=False)
+        query_embedding = await embed(user_query)
+        size = self.rerank_candidates if self.reranker is not None else self.TOP_K
+        
+        es_service = get_async_elasticsearch_service()
+        
+        if self.retrieval_mode == 'hybrid':
+            docs = await es_service.hybrid_search(
+                settings.ES_INDEX_NEWS,
+                user_query,
+                query_embedding,
+                size=size,
+                vector_store=self.vector_store
+            )
+        else:
+            try:
+                docs = await self.vector_store.asearch(
+                    query_embedding,
+                    size=size * self.CHUNKS_PER_PARENT
+                )
+            except Exception as e:
+                logger.warning(f"Vector search failed, falling back to text search: {str(e)}")
+                docs = await es_service.search_text(
+                    settings.ES_INDEX_NEWS,
+                    user_query,
+                    size=size * self.CHUNKS_PER_PARENT
+                )
+            docs = collapse_to_parents(docs, size)
+        
+        if self.reranker is not None:
+            rerank = sync_to_async(self.reranker.rerank, thread_sensitive=False)
+            docs = await rerank(user_query, docs, top_n=self.TOP_K)
+        
+        return query_embedding, docs
+    
+    def _get_cached_answer(self, query_embedding, docs, context, session_history, user_id):
+        """
+        Look up a cached answer for a semantically equivalent query
+        
+        Follow-up questions depend on the conversation, so queries with
+        session history are never served from the cache.
+        """
+        if self.answer_cache is None or session_history:
+            return None
+        
+        cached = self.answer_cache.get(
+            (user_id, context),
+            query_embedding,
+            SemanticAnswerCache.doc_ids(docs)
+        )
+        if cached is not None:
+            logger.debug(f"Answer cache hit for user {user_id}")
+        return cached
+    
+    def _cache_answer(self, query_embedding, docs, context, session_history, user_id, result, failed=False):
+        """
+        Store a generated answer for semantically equivalent queries
+        
+        Failed generations are never cached, so the next identical query
+        retries the LLM instead of replaying the fallback answer.
+        """
+        if self.answer_cache is None or session_history or failed:
+            return
+        
+        self.answer_cache.put(
+            (user_id, context),
+            query_embedding,
+            SemanticAnswerCache.doc_ids(docs),
+            result
+        )
+    
+    def answer_cache_stats(self):
+        """
+        Answer cache counters, or None when caching is disabled
+        """
+        if self.answer_cache is None:
+            return None
+        return self.answer_cache.stats()
+    
+    def _build_result(self, answer, docs):
+        """
+        Format the pipeline output
+        """
+        return {
+            'answer': answer,
+            'sources': self._format_sources(docs),
+            'confidence': self._calculate_confidence(docs),
+            'model_version': self.openai_model
+        }
+    
+    def _build_prompt(self, user_query, docs, context="", session_history=None):
+        """
+        Build the OpenAI messages within the prompt token budget
+        
+        History takes up to its own budget, most recent messages first;
+        documents fill whatever remains in relevance order.
+        """
+        fixed_tokens = self._count_message_tokens(self._build_messages(user_query, context))
+        available = max(self.prompt_token_budget - fixed_tokens, 0)
+        
+        history, history_tokens = self.packer.pack_history(
+            (session_history or [])[-5:],
+            min(self.history_token_budget, available)
+        )
+        
+        context_text = self._build_context(docs, context, budget=available - history_tokens)
+        return self._build_messages(user_query, context_text, history)
+    
+    def _count_message_tokens(self, messages):
+        return sum(self.packer.count_tokens(msg['content']) + MESSAGE_OVERHEAD for msg in messages)
+    
+    def _build_context(self, docs, additional_context="", budget=None):
         """
         Build context string from retrieved documents
+        
+        Documents are trimmed at sentence boundaries to fit the token budget.
         """
         if not docs:
             return additional_context
         
+        if budget is None:
+            budget = self.prompt_token_budget
+        packed, _ = self.packer.pack_documents(docs, budget)
+        
         context_parts = []
         
-        for i, doc in enumerate(docs, 1):
-            source = doc.get('_source', {})
-            title = source.get('title', 'Untitled')
-            text = source.get('text', source.get('content', ''))
-            
-            context_parts.append(f"[Document {i}]\nTitle: {title}\nContent: {text[:500]}...")
+        for i, (title, text, trimmed) in enumerate(packed, 1):
+            context_parts.append(f"[Document {i}]\nTitle: {title}\nContent: {text}{'...' if trimmed else ''}")
         
         context_text = "\n\n".join(context_parts)
         
@@ -139,7 +388,7 @@ Please provide a helpful answer based on the context above. Include citations to
     
     def _query_openai(self, messages):
         """
-        Query OpenAI API
+        Query OpenAI API, returning None if the request fails
         """
         try:
             response = openai.ChatCompletion.create(
@@ -151,8 +400,45 @@ Please provide a helpful answer based on the context above. Include citations to
             return response.choices[0].message.content
         except Exception as e:
             logger.error(f"OpenAI API error: {str(e)}")
-            # Fallback response if OpenAI fails
-            return "I apologize, but I'm currently unable to process your request. Please try again later."
+            return None
+    
+    async def _aquery_openai(self, messages):
+        """
+        Query OpenAI API with the async client, returning None if it fails
+        """
+        try:
+            response = await get_async_openai_client().chat.completions.create(
+                model=self.openai_model,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=500
+            )
+            return response.choices[0].message.content
+        except Exception as e:
+            logger.error(f"OpenAI API error: {str(e)}")
+            return None
+    
+    async def _astream_openai(self, messages):
+        """
+        Stream completion tokens from OpenAI as they are generated
+        
+        Errors are logged and re-raised; tokens already yielded cannot be
+        taken back, so the caller decides how to end the stream.
+        """
+        try:
+            stream = await get_async_openai_client().chat.completions.create(
+                model=self.openai_model,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=500,
+                stream=True
+            )
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            logger.error(f"OpenAI API error: {str(e)}")
+            raise
     
     def _format_sources(self, docs):
         """
@@ -163,7 +449,7 @@ Please provide a helpful answer based on the context above. Include citations to
         for doc in docs:
             source_data = doc.get('_source', {})
             sources.append({
-                'id': doc.get('_id'),
+                'id': source_data.get('parent_id') or doc.get('_id'),
                 'title': source_data.get('title', 'Untitled'),
                 'snippet': source_data.get('text', source_data.get('content', ''))[:200] + '...',
                 'source': source_data.get('source', 'Unknown'),
@@ -182,6 +468,10 @@ Please provide a helpful answer based on the context above. Include citations to
         # Use the top document's score as confidence
         top_score = docs[0].get('_score', 0)
         
+        # Fused hybrid scores are already normalized to 0-1
+        if self.retrieval_mode == 'hybrid':
+            return round(max(top_score, 0.3), 2)
+        
         # Normalize score to 0-1 range (ES scores can vary widely)
         # This is a simple heuristic
         confidence = min(top_score / 10.0, 1.0)
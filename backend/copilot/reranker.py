@@ -0,0 +1,99 @@
+"""
+Cross-encoder re-ranking of retrieved documents
+"""
+
+from django.conf import settings
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CrossEncoderReranker:
+    """
+    Re-scores (query, document) pairs with a local cross-encoder
+
+    Runs batched on CPU within a latency budget. When the estimated or
+    actual scoring time exceeds the budget, the documents are returned
+    in their retrieval order instead.
+    """
+
+    def __init__(self, model_name, budget_ms=150, batch_size=16, max_length=256):
+        self.model = None
+        self.model_name = model_name
+        self.budget = budget_ms / 1000.0
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.seconds_per_pair = None  # Running estimate from previous calls
+        self._lock = threading.Lock()
+
+    def load_model(self):
+        """
+        Load the cross-encoder (lazy loading)
+        """
+        with self._lock:
+            if self.model is None:
+                from sentence_transformers import CrossEncoder
+                logger.info(f"Loading re-ranking model: {self.model_name}")
+                self.model = CrossEncoder(self.model_name, max_length=self.max_length, device='cpu')
+
+    @staticmethod
+    def _document_text(doc):
+        source = doc.get('_source', {})
+        return f"{source.get('title', '')}\n{source.get('text', source.get('content', ''))}"
+
+    def rerank(self, query, docs, top_n=5):
+        """
+        Return the top_n documents by cross-encoder score
+
+        Each returned hit carries its score as '_rerank_score'; '_score'
+        keeps the retrieval score.
+        """
+        if len(docs) <= 1:
+            return docs[:top_n]
+
+        try:
+            self.load_model()
+        except Exception as e:
+            logger.error(f"Error loading re-ranking model: {str(e)}")
+            return docs[:top_n]
+
+        if self.seconds_per_pair is not None and self.seconds_per_pair * len(docs) > self.budget:
+            logger.info(f"Skipping re-ranking of {len(docs)} documents, estimated over budget")
+            # Retry with a decayed estimate so one slow run doesn't disable re-ranking
+            self.seconds_per_pair *= 0.9
+            return docs[:top_n]
+
+        pairs = [(query, self._document_text(doc)) for doc in docs]
+        scores = []
+        started = time.perf_counter()
+
+        for i in range(0, len(pairs), self.batch_size):
+            scores.extend(self.model.predict(pairs[i:i + self.batch_size], batch_size=self.batch_size))
+
+            elapsed = time.perf_counter() - started
+            self.seconds_per_pair = elapsed / len(scores)
+            if elapsed > self.budget and len(scores) < len(pairs):
+                logger.warning(f"Re-ranking exceeded {self.budget * 1000:.0f}ms budget, keeping retrieval order")
+                return docs[:top_n]
+
+        ranked = sorted(zip(scores, range(len(docs))), key=lambda item: item[0], reverse=True)
+        return [dict(docs[i], _rerank_score=float(score)) for score, i in ranked[:top_n]]
+
+
+# Singleton instance
+_reranker = None
+
+def get_reranker():
+    """
+    Get the re-ranker, or None when re-ranking is disabled
+    """
+    global _reranker
+    if _reranker is None and settings.COPILOT_RERANK_ENABLED:
+        _reranker = CrossEncoderReranker(
+            settings.COPILOT_RERANK_MODEL,
+            budget_ms=settings.COPILOT_RERANK_BUDGET_MS,
+            batch_size=settings.COPILOT_RERANK_BATCH_SIZE
+        )
+    return _reranker
@@ -1,6 +1,13 @@
 from django.test import TestCase
 from django.contrib.auth.models import User
+from django.urls import reverse
+from unittest.mock import AsyncMock, MagicMock, patch
+from .answer_cache import SemanticAnswerCache
+from .context_packer import ContextPacker
 from .models import ChatSession, ChatMessage
+from .rag_service import RAGService
+from .reranker import CrossEncoderReranker
+import numpy as np
 
 
 class CopilotTestCase(TestCase):
@@ -24,3 +31,237 @@ class CopilotTestCase(TestCase):
         self.assertEqual(message.role, 'user')
         self.assertEqual(self.session.messages.count(), 1)
 
+
+class AsyncChatQueryTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.rag_service = MagicMock()
+        self.rag_service.aquery = AsyncMock(return_value={
+            'answer': 'ROAS dropped because spend rose.',
+            'sources': [],
+            'confidence': 0.5,
+            'model_version': 'test-model'
+        })
+    
+    def test_requires_authentication(self):
+        response = self.client.post(reverse('copilot:query_async'), {'message': 'Hi'}, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+    
+    def test_async_query_saves_messages(self):
+        self.client.force_login(self.user)
+        with patch('copilot.views.get_rag_service', return_value=self.rag_service):
+            response = self.client.post(
+                reverse('copilot:query_async'),
+                {'message': 'Why did ROAS drop?'},
+                content_type='application/json'
+            )
+        
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['data']['message']['content'], 'ROAS dropped because spend rose.')
+        session = ChatSession.objects.get(id=body['data']['session_id'])
+        self.assertEqual(session.messages.count(), 2)
+        self.assertEqual(session.title, 'Why did ROAS drop?')
+    
+    async def test_stream_query_sends_sources_tokens_and_saves_message(self):
+        async def astream_query(**kwargs):
+            yield {'event': 'sources', 'data': {'sources': [], 'confidence': 0.5}}
+            yield {'event': 'token', 'data': {'content': 'ROAS dropped '}}
+            yield {'event': 'token', 'data': {'content': 'because spend rose.'}}
+            yield {'event': 'done', 'data': {
+                'answer': 'ROAS dropped because spend rose.',
+                'sources': [],
+                'confidence': 0.5,
+                'model_version': 'test-model'
+            }}
+        
+        self.rag_service.astream_query = astream_query
+        await self.async_client.aforce_login(self.user)
+        with patch('copilot.views.get_rag_service', return_value=self.rag_service):
+            response = await self.async_client.post(
+                reverse('copilot:query_stream'),
+                {'message': 'Why did ROAS drop?'},
+                content_type='application/json'
+            )
+            body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = [frame.split('\n')[0] for frame in body.strip().split('\n\n')]
+        self.assertEqual(events, ['event: sources', 'event: token', 'event: token', 'event: done'])
+        message = await ChatMessage.objects.select_related('session').aget(role='assistant')
+        self.assertEqual(message.content, 'ROAS dropped because spend rose.')
+        self.assertEqual(message.session.title, 'Why did ROAS drop?')
+    
+    async def test_stream_error_is_sent_and_not_saved(self):
+        async def astream_query(**kwargs):
+            yield {'event': 'sources', 'data': {'sources': [], 'confidence': 0.5}}
+            yield {'event': 'token', 'data': {'content': 'ROAS dropped '}}
+            yield {'event': 'error', 'data': {'message': RAGService.STREAM_ERROR_MESSAGE}}
+        
+        self.rag_service.astream_query = astream_query
+        await self.async_client.aforce_login(self.user)
+        with patch('copilot.views.get_rag_service', return_value=self.rag_service):
+            response = await self.async_client.post(
+                reverse('copilot:query_stream'),
+                {'message': 'Why did ROAS drop?'},
+                content_type='application/json'
+            )
+            body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        
+        events = [frame.split('\n')[0] for frame in body.strip().split('\n\n')]
+        self.assertEqual(events, ['event: sources', 'event: token', 'event: error'])
+        self.assertFalse(await ChatMessage.objects.filter(role='assistant').aexists())
+
+
+class RAGServiceStreamTestCase(TestCase):
+    def setUp(self):
+        self.service = object.__new__(RAGService)
+        self.service.retrieval_mode = 'hybrid'
+        self.service.openai_model = 'test-model'
+        self.service.answer_cache = MagicMock()
+        self.service.answer_cache.get.return_value = None
+        self.service._aretrieve = AsyncMock(return_value=(np.array([1.0, 0.0]), []))
+        self.service._build_prompt = MagicMock(return_value=[])
+    
+    async def _collect(self):
+        return [item async for item in self.service.astream_query('Why did ROAS drop?')]
+    
+    async def test_completed_stream_is_cached(self):
+        async def astream_openai(messages):
+            yield 'Spend '
+            yield 'rose.'
+        
+        self.service._astream_openai = astream_openai
+        items = await self._collect()
+        
+        self.assertEqual([item['event'] for item in items], ['sources', 'token', 'token', 'done'])
+        self.assertEqual(items[-1]['data']['answer'], 'Spend rose.')
+        self.service.answer_cache.put.assert_called_once()
+    
+    async def test_failed_stream_ends_with_error_and_is_not_cached(self):
+        async def astream_openai(messages):
+            yield 'Spend '
+            raise RuntimeError('connection reset')
+        
+        self.service._astream_openai = astream_openai
+        items = await self._collect()
+        
+        self.assertEqual([item['event'] for item in items], ['sources', 'token', 'error'])
+        self.service.answer_cache.put.assert_not_called()
+    
+    async def test_failed_query_returns_fallback_and_is_not_cached(self):
+        self.service._aquery_openai = AsyncMock(return_value=None)
+        
+        result = await self.service.aquery('Why did ROAS drop?')
+        
+        self.assertEqual(result['answer'], RAGService.FALLBACK_ANSWER)
+        self.service.answer_cache.put.assert_not_called()
+
+
+class SemanticAnswerCacheTestCase(TestCase):
+    def setUp(self):
+        self.cache = SemanticAnswerCache(max_entries=2, ttl=60, threshold=0.95)
+        self.docs = frozenset(['doc_1', 'doc_2'])
+        self.result = {'answer': 'Spend rose.', 'sources': [], 'confidence': 0.5, 'model_version': 'test-model'}
+    
+    def test_near_identical_query_hits(self):
+        self.cache.put((1, ''), np.array([1.0, 0.0]), self.docs, self.result)
+        
+        self.assertEqual(self.cache.get((1, ''), np.array([0.99, 0.05]), self.docs), self.result)
+        self.assertIsNone(self.cache.get((1, ''), np.array([0.0, 1.0]), self.docs))
+        self.assertEqual(self.cache.stats()['hit_rate'], 0.5)
+    
+    def test_scoped_by_user_and_retrieved_documents(self):
+        self.cache.put((1, ''), np.array([1.0, 0.0]), self.docs, self.result)
+        
+        self.assertIsNone(self.cache.get((2, ''), np.array([1.0, 0.0]), self.docs))
+        self.assertIsNone(self.cache.get((1, ''), np.array([1.0, 0.0]), frozenset(['doc_3'])))
+    
+    def test_doc_ids_use_parent_article(self):
+        first = [{'_id': 'doc_1_chunk_0', '_source': {'parent_id': 'doc_1'}}]
+        second = [{'_id': 'doc_1_chunk_2', '_source': {'parent_id': 'doc_1'}}]
+        
+        self.assertEqual(SemanticAnswerCache.doc_ids(first), SemanticAnswerCache.doc_ids(second))
+    
+    def test_expiry_and_eviction(self):
+        self.cache.put((1, ''), np.array([1.0, 0.0]), self.docs, self.result)
+        self.cache.put((2, ''), np.array([1.0, 0.0]), self.docs, self.result)
+        self.cache.put((3, ''), np.array([1.0, 0.0]), self.docs, self.result)
+        
+        self.assertIsNone(self.cache.get((1, ''), np.array([1.0, 0.0]), self.docs))
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+        
+        with patch('copilot.answer_cache.time.monotonic', return_value=float('inf')):
+            self.assertIsNone(self.cache.get((2, ''), np.array([1.0, 0.0]), self.docs))
+        self.assertEqual(self.cache.stats()['expirations'], 1)
+
+
+class CrossEncoderRerankerTestCase(TestCase):
+    def setUp(self):
+        self.reranker = CrossEncoderReranker('test-model', budget_ms=100, batch_size=2)
+        self.reranker.model = MagicMock()
+        self.reranker.model.predict.side_effect = lambda pairs, batch_size: [len(text) for _, text in pairs]
+        self.docs = [
+            {'_id': 'short', '_score': 3.0, '_source': {'title': 'a', 'text': 'x'}},
+            {'_id': 'long', '_score': 2.0, '_source': {'title': 'a', 'text': 'x' * 20}},
+            {'_id': 'medium', '_score': 1.0, '_source': {'title': 'a', 'text': 'x' * 10}},
+        ]
+    
+    def test_rerank_keeps_best_scored(self):
+        ranked = self.reranker.rerank('roas', self.docs, top_n=2)
+        
+        self.assertEqual([doc['_id'] for doc in ranked], ['long', 'medium'])
+        self.assertEqual(ranked[0]['_score'], 2.0)
+        self.assertEqual(self.reranker.model.predict.call_count, 2)
+    
+    def test_skips_when_estimated_over_budget(self):
+        self.reranker.seconds_per_pair = 1.0
+        
+        ranked = self.reranker.rerank('roas', self.docs, top_n=2)
+        
+        self.assertEqual([doc['_id'] for doc in ranked], ['short', 'long'])
+        self.reranker.model.predict.assert_not_called()
+    
+    def test_aborts_when_budget_is_exceeded(self):
+        with patch('copilot.reranker.time.perf_counter', side_effect=[0.0, 1.0]):
+            ranked = self.reranker.rerank('roas', self.docs, top_n=2)
+        
+        self.assertEqual([doc['_id'] for doc in ranked], ['short', 'long'])
+        self.assertEqual(self.reranker.model.predict.call_count, 1)
+
+
+class ContextPackerTestCase(TestCase):
+    def setUp(self):
+        self.packer = ContextPacker(lambda text: len(text.split()))
+    
+    def test_trim_at_sentence_boundary(self):
+        text, tokens = self.packer.trim('ROAS fell last week. Spend rose sharply. CPC was flat.', 7)
+        
+        self.assertEqual(text, 'ROAS fell last week. Spend rose sharply.')
+        self.assertEqual(tokens, 7)
+    
+    def test_pack_documents_fills_budget_by_relevance(self):
+        docs = [
+            {'_source': {'title': 'First', 'text': ' '.join(['word'] * 30) + '.'}},
+            {'_source': {'title': 'Second', 'text': 'Short one.'}},
+        ]
+        
+        packed, used = self.packer.pack_documents(docs, 40)
+        
+        self.assertEqual([title for title, _, _ in packed], ['First'])
+        self.assertLessEqual(used, 40)
+    
+    def test_pack_history_keeps_most_recent(self):
+        history = [
+            {'role': 'user', 'content': 'An old question about ROAS trends.'},
+            {'role': 'assistant', 'content': 'An old answer. It was long.'},
+            {'role': 'user', 'content': 'A new question.'},
+        ]
+        
+        packed, used = self.packer.pack_history(history, 20)
+        
+        self.assertEqual([msg['content'] for msg in packed], ['An old answer. It was long.', 'A new question.'])
+        self.assertLessEqual(used, 20)
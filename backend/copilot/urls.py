@@ -10,6 +10,8 @@ router.register(r'sessions', views.ChatSessionViewSet, basename='session')
 urlpatterns = [
     path('', include(router.urls)),
     path('query/', views.chat_query_view, name='query'),
+    path('query/async/', views.chat_query_async_view, name='query_async'),
+    path('query/stream/', views.chat_stream_view, name='query_stream'),
     path('history/<int:session_id>/', views.chat_history_view, name='history'),
     path('sessions/<int:session_id>/clear/', views.clear_session_view, name='clear_session'),
 ]
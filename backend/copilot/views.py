@@ -2,12 +2,16 @@ from rest_framework import status, viewsets
 from rest_framework.decorators import api_view, permission_classes, action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.views.decorators.http import require_POST
 from .models import ChatSession, ChatMessage
 from .serializers import ChatSessionSerializer, ChatMessageSerializer, ChatQuerySerializer
 from .rag_service import get_rag_service
-from core.responses import success_response, error_response
+from core.responses import success_response, error_response, json_success_response, json_error_response
 from core.exceptions import OpenAIAPIError
+import json
 import logging
 
 logger = logging.getLogger(__name__)
@@ -100,7 +104,8 @@ def chat_query_view(request):
         result = rag_service.query(
             user_query=message,
             context=context,
-            session_history=history[:-1]  # Exclude the current message
+            session_history=history[:-1],  # Exclude the current message
+            user_id=request.user.id
         )
         
         # Save assistant message
@@ -134,6 +139,166 @@ def chat_query_view(request):
         )
 
 
+async def _aprepare_chat(request):
+    """
+    Authenticate, validate and record the user message for async chat views
+    
+    Returns (session, message, context, history), or an error JsonResponse.
+    """
+    user = await request.auser()
+    if not user.is_authenticated:
+        return json_error_response(
+            "Authentication credentials were not provided.",
+            status_code=status.HTTP_403_FORBIDDEN
+        )
+    
+    try:
+        data = json.loads(request.body or b'{}')
+    except json.JSONDecodeError:
+        return json_error_response("Invalid JSON body")
+    
+    serializer = ChatQuerySerializer(data=data)
+    
+    if not serializer.is_valid():
+        return json_error_response("Invalid query", errors=serializer.errors)
+    
+    message = serializer.validated_data['message']
+    session_id = serializer.validated_data.get('session_id')
+    context = serializer.validated_data.get('context', '')
+    
+    # Get or create session
+    if session_id:
+        try:
+            session = await ChatSession.objects.aget(id=session_id, user=user)
+        except ChatSession.DoesNotExist:
+            return json_error_response("Session not found", status_code=status.HTTP_404_NOT_FOUND)
+    else:
+        session = await ChatSession.objects.acreate(user=user)
+    
+    # Save user message
+    await ChatMessage.objects.acreate(
+        session=session,
+        role='user',
+        content=message
+    )
+    
+    # Get session history
+    history = [msg async for msg in session.messages.values('role', 'content')]
+    
+    return session, message, context, history[:-1]  # Exclude the current message
+
+
+async def _asave_assistant_message(session, message, result):
+    """
+    Persist the assistant reply and title the session on its first exchange
+    """
+    assistant_message = await ChatMessage.objects.acreate(
+        session=session,
+        role='assistant',
+        content=result['answer'],
+        sources=result['sources'],
+        confidence=result['confidence'],
+        model_version=result['model_version']
+    )
+    
+    # Update session title if it's the first message
+    if await session.messages.acount() == 2:  # user + assistant
+        session.title = message[:50] + ('...' if len(message) > 50 else '')
+        await session.asave()
+    
+    return assistant_message
+
+
+@require_POST
+async def chat_query_async_view(request):
+    """
+    Async variant of chat_query_view, served through ASGI
+    
+    Does not hold a worker while waiting on Elasticsearch and OpenAI.
+    """
+    prepared = await _aprepare_chat(request)
+    if isinstance(prepared, HttpResponse):
+        return prepared
+    session, message, context, history = prepared
+    
+    # Process through RAG service
+    try:
+        rag_service = get_rag_service()
+        result = await rag_service.aquery(
+            user_query=message,
+            context=context,
+            session_history=history,
+            user_id=session.user_id
+        )
+        
+        assistant_message = await _asave_assistant_message(session, message, result)
+        
+        response_data = {
+            'session_id': session.id,
+            'message': ChatMessageSerializer(assistant_message).data
+        }
+        
+        return json_success_response(response_data, message="Query processed successfully")
+    
+    except Exception as e:
+        logger.error(f"Error processing chat query: {str(e)}")
+        return json_error_response(
+            "Failed to process query. Please try again.",
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
+
+
+def _sse_event(event, data):
+    """
+    Format one Server-Sent Events frame
+    """
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+@require_POST
+async def chat_stream_view(request):
+    """
+    Stream a chat answer as Server-Sent Events
+    
+    Sends a 'sources' event once retrieval finishes, 'token' events as
+    the LLM generates, and a final 'done' event after the assistant
+    message is saved. A failed generation ends with an 'error' event
+    and nothing is saved.
+    """
+    prepared = await _aprepare_chat(request)
+    if isinstance(prepared, HttpResponse):
+        return prepared
+    session, message, context, history = prepared
+    
+    async def events():
+        try:
+            rag_service = get_rag_service()
+            async for item in rag_service.astream_query(
+                user_query=message,
+                context=context,
+                session_history=history,
+                user_id=session.user_id
+            ):
+                if item['event'] != 'done':
+                    yield _sse_event(item['event'], item['data'])
+                    continue
+                
+                assistant_message = await _asave_assistant_message(session, message, item['data'])
+                yield _sse_event('done', {
+                    'session_id': session.id,
+                    'message': ChatMessageSerializer(assistant_message).data
+                })
+        
+        except Exception as e:
+            logger.error(f"Error streaming chat query: {str(e)}")
+            yield _sse_event('error', {'message': "Failed to process query. Please try again."})
+    
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Disable proxy buffering
+    return response
+
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def chat_history_view(request, session_id):
@@ -0,0 +1,85 @@
+"""
+Shared Elasticsearch clients
+
+Every module should get its client here rather than constructing one,
+so that each process keeps a single pool of keep-alive connections.
+"""
+
+from django.conf import settings
+from core.loop_local import LoopLocal
+import os
+import threading
+
+try:
+    # Serializes float32 embedding arrays straight from their buffers
+    from elasticsearch.serializer import OrjsonSerializer
+except ImportError:
+    OrjsonSerializer = None
+
+
+def client_options():
+    """
+    Connection pool, retry and sniffing options from settings
+    """
+    options = {
+        'connections_per_node': settings.ES_CONNECTIONS_PER_NODE,
+        'request_timeout': settings.ES_REQUEST_TIMEOUT,
+        'max_retries': settings.ES_MAX_RETRIES,
+        'retry_on_timeout': settings.ES_RETRY_ON_TIMEOUT,
+    }
+    if settings.ES_SNIFF:
+        # Only useful when the nodes are directly reachable, not behind a proxy
+        options.update(
+            sniff_on_start=True,
+            sniff_on_node_failure=True,
+            min_delay_between_sniffing=settings.ES_SNIFF_INTERVAL
+        )
+    if OrjsonSerializer is not None:
+        options['serializer'] = OrjsonSerializer()
+    return options
+
+
+# Singleton instance, per process
+_es_client = None
+_es_client_lock = threading.Lock()
+
+def get_es_client():
+    """
+    Get the shared Elasticsearch client
+
+    For a different timeout on a single call, use
+    get_es_client().options(request_timeout=...).
+    """
+    global _es_client
+    if _es_client is None:
+        from elasticsearch import Elasticsearch
+        with _es_client_lock:
+            if _es_client is None:
+                _es_client = Elasticsearch([settings.ES_HOST], **client_options())
+    return _es_client
+
+
+def _new_async_es_client():
+    from elasticsearch import AsyncElasticsearch
+    return AsyncElasticsearch([settings.ES_HOST], **client_options())
+
+
+# One async client per event loop, since its connections are bound to
+# the loop they were opened on
+_async_es_clients = LoopLocal(_new_async_es_client, aclose=lambda client: client.close())
+
+def get_async_es_client():
+    """
+    Get the shared async Elasticsearch client for the running event loop
+    """
+    return _async_es_clients.get()
+
+
+def _reset_after_fork():
+    # Forked workers must not share the parent's sockets
+    global _es_client
+    _es_client = None
+    _async_es_clients.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
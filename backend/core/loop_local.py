@@ -0,0 +1,62 @@
+"""
+Objects bound to the running event loop, such as async HTTP clients
+"""
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLocal:
+    """
+    One object per running event loop, closed when that loop shuts down
+
+    Async clients keep connections, and a reference, to the loop they
+    were created on. Under uvicorn there is one long-lived loop; under
+    runserver, WSGI or tests every async request gets a new loop. Each
+    object is therefore closed with aclose from the loop's async
+    generator shutdown, which asyncio.run and async_to_sync both run,
+    and dropped. Objects of loops closed without that step are dropped
+    on the next lookup.
+    """
+
+    def __init__(self, factory, aclose=None):
+        self.factory = factory
+        self.aclose = aclose
+        self._objects = {}  # loop -> (object, finalizer)
+
+    def get(self):
+        loop = asyncio.get_running_loop()
+        entry = self._objects.get(loop)
+        if entry is not None:
+            return entry[0]
+
+        self._prune()
+        obj = self.factory()
+        finalizer = self._finalizer(loop, obj)
+        self._objects[loop] = (obj, finalizer)
+        # Start the generator so that the loop tracks it for shutdown
+        loop.create_task(finalizer.__anext__())
+        return obj
+
+    async def _finalizer(self, loop, obj):
+        try:
+            yield
+        finally:
+            self._objects.pop(loop, None)
+            if self.aclose is not None:
+                try:
+                    await self.aclose(obj)
+                except Exception as e:
+                    logger.warning(f"Error closing {type(obj).__name__}: {str(e)}")
+
+    def _prune(self):
+        for loop in [loop for loop in self._objects if loop.is_closed()]:
+            self._objects.pop(loop, None)
+
+    def clear(self):
+        self._objects.clear()
+
+    def __len__(self):
+        return len(self._objects)
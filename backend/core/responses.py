@@ -2,6 +2,7 @@
 Standard API response formats
 """
 
+from django.http import JsonResponse
 from rest_framework.response import Response
 from rest_framework import status
 
@@ -43,3 +44,24 @@ def paginated_response(data, page, total_pages, total_count, message="Success"):
         }
     })
 
+
+def json_success_response(data=None, message="Success", status_code=status.HTTP_200_OK):
+    """
+    Standard success response format for plain (non-DRF) views, e.g. async views
+    """
+    return JsonResponse({
+        'success': True,
+        'message': message,
+        'data': data
+    }, status=status_code)
+
+
+def json_error_response(message="An error occurred", errors=None, status_code=status.HTTP_400_BAD_REQUEST):
+    """
+    Standard error response format for plain (non-DRF) views, e.g. async views
+    """
+    return JsonResponse({
+        'success': False,
+        'message': message,
+        'errors': errors
+    }, status=status_code)
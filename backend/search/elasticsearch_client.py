@@ -1,4 +0,0 @@
-from elasticsearch import Elasticsearch
-from django.conf import settings
-
-es = Elasticsearch([settings.ES_HOST])
\ No newline at end of file
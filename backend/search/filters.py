@@ -0,0 +1,114 @@
+"""
+Normalized, cache-friendly query clauses for news search
+
+Equivalent filter combinations always produce identical clauses (terms
+sorted and de-duplicated, dates rounded to the day), so Elasticsearch's
+node query cache and shard request cache can serve repeated searches.
+"""
+
+from django.utils.dateparse import parse_date, parse_datetime
+from functools import lru_cache
+
+TEXT_FIELDS = ["title^3", "content", "category.major", "src"]
+SUGGEST_FIELDS = ["title.suggest", "title.suggest._2gram", "title.suggest._3gram"]
+
+
+def normalize_day(value):
+    """
+    Calendar day (YYYY-MM-DD) of an ISO date or datetime string
+    """
+    if not value:
+        return None
+    try:
+        parsed = parse_datetime(value) or parse_date(value)
+    except (TypeError, ValueError):
+        parsed = None
+    if parsed is None:
+        raise ValueError(f"Invalid date: {value}")
+    return parsed.strftime("%Y-%m-%d")
+
+
+def normalize_terms(values):
+    """
+    Sorted, de-duplicated tuple of filter values
+    """
+    if not values:
+        return ()
+    if isinstance(values, str):
+        values = [values]
+    return tuple(sorted({str(value) for value in values}))
+
+
+@lru_cache(maxsize=512)
+def filter_clauses(from_day=None, to_day=None, priority_levels=(), impacts=(), journals=()):
+    """
+    Filter-context clauses for normalized filter values, memoized
+
+    Date bounds are whole days: from the start of from_day to the end of
+    to_day. The returned clauses are shared between calls and must not be
+    modified.
+    """
+    clauses = []
+
+    if from_day or to_day:
+        date_range = {}
+        if from_day:
+            date_range["gte"] = f"{from_day}||/d"
+        if to_day:
+            date_range["lte"] = f"{to_day}||/d"
+        clauses.append({"range": {"date": date_range}})
+
+    for field, values in (
+        ("priority_level.keyword", priority_levels),
+        ("impact.keyword", impacts),
+        ("src.keyword", journals),
+    ):
+        if values:
+            clauses.append({"terms": {field: list(values)}})
+
+    return tuple(clauses)
+
+
+def build_news_query(query, filters):
+    """
+    Scored text query within filters, or constant_score when there is no text
+    """
+    if query:
+        return {
+            "bool": {
+                "must": [{
+                    "multi_match": {
+                        "query": query,
+                        "fields": TEXT_FIELDS,
+                        "type": "most_fields"
+                    }
+                }],
+                "filter": list(filters)
+            }
+        }
+
+    if not filters:
+        return {"match_all": {}}
+    return {"constant_score": {"filter": {"bool": {"filter": list(filters)}}}}
+
+
+def build_suggest_body(prefix, size, timeout_ms):
+    """
+    Search-as-you-type request for titles starting with, or containing, prefix
+
+    The shard timeout returns partial results rather than exceeding the
+    latency budget.
+    """
+    return {
+        "query": {
+            "multi_match": {
+                "query": prefix,
+                "type": "bool_prefix",
+                "fields": SUGGEST_FIELDS
+            }
+        },
+        "size": size,
+        "_source": ["title"],
+        "track_total_hits": False,
+        "timeout": f"{int(timeout_ms)}ms"
+    }
@@ -0,0 +1,19 @@
+"""
+Management command to create the news search index with its mapping
+"""
+
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from core.es_client import get_es_client
+from search.news_index import create_news_index
+
+
+class Command(BaseCommand):
+    help = 'Create the news search index with explicit keyword/date mappings'
+
+    def handle(self, *args, **options):
+        index_name = settings.ES_INDEX_SEARCH_NEWS
+        if create_news_index(get_es_client(), index_name):
+            self.stdout.write(self.style.SUCCESS(f'Created index {index_name}'))
+        else:
+            self.stdout.write(f'Index {index_name} already exists')
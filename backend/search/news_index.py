@@ -0,0 +1,96 @@
+"""
+Mapping and sortable fields of the news search index
+"""
+
+# Text fields keep a keyword subfield for exact filters and sorting
+_TEXT_WITH_KEYWORD = {
+    "type": "text",
+    "fields": {"keyword": {"type": "keyword", "ignore_above": 256}}
+}
+
+NEWS_INDEX_MAPPING = {
+    "mappings": {
+        "properties": {
+            # title.suggest is filled at index time for search-as-you-type
+            "title": {
+                "type": "text",
+                "fields": {
+                    "keyword": {"type": "keyword", "ignore_above": 256},
+                    "suggest": {"type": "search_as_you_type", "max_shingle_size": 3}
+                }
+            },
+            "content": {"type": "text"},
+            "category": {
+                "properties": {
+                    "major": _TEXT_WITH_KEYWORD
+                }
+            },
+            "src": _TEXT_WITH_KEYWORD,
+            "priority_level": _TEXT_WITH_KEYWORD,
+            "impact": _TEXT_WITH_KEYWORD,
+            "date": {"type": "date"},
+            "content_vector": {"type": "dense_vector", "index": False}
+        }
+    }
+}
+
+# Client-facing sort names and the fields they sort on
+SORT_FIELDS = {
+    "date": "date",
+    "relevance": "_score",
+    "priority_level": "priority_level.keyword",
+    "impact": "impact.keyword",
+    "journal": "src.keyword",
+    "title": "title.keyword",
+}
+
+# Facets: request name -> keyword field counted with a terms aggregation
+FACET_FIELDS = {
+    "priority_level": "priority_level.keyword",
+    "impact": "impact.keyword",
+    "journals": "src.keyword",
+}
+
+DATE_FACET = "date"
+DATE_FACET_INTERVALS = ("day", "week", "month", "quarter", "year")
+
+
+def facet_aggregations(facets, terms_size=20, date_interval="month"):
+    """
+    Elasticsearch aggregations for the requested facet names
+    """
+    aggs = {}
+    for name in facets:
+        if name in FACET_FIELDS:
+            aggs[name] = {"terms": {"field": FACET_FIELDS[name], "size": terms_size}}
+        elif name == DATE_FACET:
+            aggs[name] = {
+                "date_histogram": {"field": "date", "calendar_interval": date_interval, "min_doc_count": 1}
+            }
+    return aggs
+
+
+def parse_facets(aggregations):
+    """
+    Flatten aggregation buckets into value/count lists
+    """
+    facets = {}
+    for name, result in aggregations.items():
+        if name == DATE_FACET:
+            facets[name] = [
+                {"value": bucket.get("key_as_string", bucket["key"]), "count": bucket["doc_count"]}
+                for bucket in result["buckets"]
+            ]
+        else:
+            facets[name] = [{"value": bucket["key"], "count": bucket["doc_count"]} for bucket in result["buckets"]]
+    return facets
+
+
+def create_news_index(es, index_name):
+    """
+    Create the news index with its explicit mapping, if missing
+    """
+    if es.indices.exists(index=index_name):
+        return False
+    es.indices.create(index=index_name, body=NEWS_INDEX_MAPPING)
+    return True
@@ -1,3 +1,141 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User
+from django.urls import reverse
+from unittest.mock import MagicMock, patch
+from elasticsearch import ConnectionTimeout, NotFoundError
+from .filters import build_news_query, filter_clauses, normalize_day, normalize_terms
 
-# Create your tests here.
+
+def _hit(doc_id, date):
+    return {'_id': doc_id, '_score': None, '_source': {'title': doc_id, 'date': date}, 'sort': [date, doc_id]}
+
+
+class SearchNewsTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='testuser',
+            password='testpass123'
+        )
+        self.client.force_login(self.user)
+        self.es = MagicMock()
+        self.es.open_point_in_time.return_value = {'id': 'pit-1'}
+        patcher = patch('search.views.get_es_client', return_value=self.es)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def post(self, data):
+        return self.client.post(reverse('search_news'), data, content_type='application/json')
+    
+    def test_pages_with_search_after_cursor(self):
+        self.es.search.return_value = {
+            'pit_id': 'pit-2',
+            'hits': {'total': {'value': 3}, 'hits': [_hit('a', 3), _hit('b', 2), _hit('c', 1)]}
+        }
+        
+        response = self.post({'query': 'rates', 'size': 2})
+        
+        data = response.json()
+        self.assertEqual([hit['_id'] for hit in data['results']], ['a', 'b'])
+        self.assertEqual(data['total'], {'value': 3})
+        body = self.es.search.call_args.kwargs['body']
+        self.assertEqual(body['size'], 3)
+        self.assertEqual(body['pit']['id'], 'pit-1')
+        self.assertEqual(body['sort'][0], {'date': {'order': 'desc'}})
+        
+        self.es.search.return_value = {'pit_id': 'pit-2', 'hits': {'hits': [_hit('c', 1)]}}
+        response = self.post({'query': 'rates', 'size': 2, 'cursor': data['next_cursor']})
+        
+        data = response.json()
+        body = self.es.search.call_args.kwargs['body']
+        self.assertEqual(body['search_after'], [2, 'b'])
+        self.assertEqual(body['pit']['id'], 'pit-2')
+        self.assertIsNone(data['next_cursor'])
+        self.es.close_point_in_time.assert_called_once_with(id='pit-2')
+        self.assertEqual(self.es.open_point_in_time.call_count, 1)
+    
+    def test_rejects_unknown_sort_and_foreign_cursor(self):
+        self.assertEqual(self.post({'sort_by': 'content'}).status_code, 400)
+        
+        self.es.search.return_value = {'hits': {'total': {'value': 2}, 'hits': [_hit('a', 2), _hit('b', 1)]}}
+        cursor = self.post({'query': 'rates', 'size': 1}).json()['next_cursor']
+        
+        self.assertEqual(self.post({'query': 'oil', 'size': 1, 'cursor': cursor}).status_code, 400)
+        self.assertEqual(self.post({'cursor': 'not-a-cursor'}).status_code, 400)
+    
+    @override_settings(SEARCH_MAX_PAGE_SIZE=5)
+    def test_page_size_is_capped(self):
+        self.es.search.return_value = {'hits': {'total': {'value': 0}, 'hits': []}}
+        
+        self.post({'size': 1000})
+        
+        self.assertEqual(self.es.search.call_args.kwargs['body']['size'], 6)
+    
+    def test_facets_in_the_same_request(self):
+        self.es.search.return_value = {
+            'hits': {'total': {'value': 3}, 'hits': [_hit('a', 2)]},
+            'aggregations': {
+                'impact': {'buckets': [{'key': 'high', 'doc_count': 2}, {'key': 'low', 'doc_count': 1}]},
+                'date': {'buckets': [{'key': 0, 'key_as_string': '2024-01-01', 'doc_count': 3}]},
+            }
+        }
+        
+        data = self.post({'impact': ['high', 'low'], 'facets': ['impact', 'date'], 'facet_interval': 'week'}).json()
+        
+        aggs = self.es.search.call_args.kwargs['body']['aggs']
+        self.assertEqual(aggs['impact']['terms']['field'], 'impact.keyword')
+        self.assertEqual(aggs['date']['date_histogram']['calendar_interval'], 'week')
+        self.assertEqual(self.es.search.call_count, 1)
+        self.assertEqual(data['facets'], {
+            'impact': [{'value': 'high', 'count': 2}, {'value': 'low', 'count': 1}],
+            'date': [{'value': '2024-01-01', 'count': 3}],
+        })
+        self.assertEqual(self.post({'facets': ['content']}).status_code, 400)
+    
+    def test_expired_cursor(self):
+        self.es.search.return_value = {'hits': {'total': {'value': 2}, 'hits': [_hit('a', 2), _hit('b', 1)]}}
+        cursor = self.post({'size': 1}).json()['next_cursor']
+        self.es.search.side_effect = NotFoundError('search_context_missing_exception', MagicMock(), {})
+        
+        self.assertEqual(self.post({'size': 1, 'cursor': cursor}).status_code, 410)
+    
+    @override_settings(SEARCH_SUGGEST_BUDGET_MS=100)
+    def test_suggestions_within_budget(self):
+        self.es.options.return_value = self.es
+        self.es.search.return_value = {'timed_out': False, 'hits': {'hits': [
+            {'_source': {'title': 'Rates rise'}}, {'_source': {'title': 'Rates rise'}}, {'_source': {'title': 'Rates hold'}}
+        ]}}
+        
+        data = self.client.get(reverse('suggest_news'), {'q': 'rat'}).json()
+        
+        self.assertEqual(data['suggestions'], ['Rates rise', 'Rates hold'])
+        self.es.options.assert_called_once_with(request_timeout=0.1, max_retries=0)
+        body = self.es.search.call_args.kwargs['body']
+        self.assertEqual(body['query']['multi_match']['type'], 'bool_prefix')
+        self.assertEqual(body['timeout'], '80ms')
+        
+        self.es.search.side_effect = ConnectionTimeout('timed out')
+        self.assertEqual(self.client.get(reverse('suggest_news'), {'q': 'rat'}).json(), {'suggestions': [], 'timed_out': True})
+        self.assertEqual(self.client.get(reverse('suggest_news'), {'q': 'r'}).json()['suggestions'], [])
+
+
+class NewsFilterTestCase(TestCase):
+    def test_equivalent_filters_share_clauses(self):
+        first = filter_clauses(normalize_day('2024-01-05T13:20:00'), None, normalize_terms(['high', 'low', 'high']))
+        second = filter_clauses(normalize_day('2024-01-05'), None, normalize_terms(['low', 'high']))
+        
+        self.assertIs(first, second)
+        self.assertEqual(first, (
+            {'range': {'date': {'gte': '2024-01-05||/d'}}},
+            {'terms': {'priority_level.keyword': ['high', 'low']}},
+        ))
+        with self.assertRaises(ValueError):
+            normalize_day('last week')
+    
+    def test_constant_score_without_text(self):
+        filters = filter_clauses(impacts=('high',))
+        
+        self.assertEqual(build_news_query('', filters), {
+            'constant_score': {'filter': {'bool': {'filter': [{'terms': {'impact.keyword': ['high']}}]}}}
+        })
+        self.assertEqual(build_news_query('', ()), {'match_all': {}})
+        self.assertEqual(build_news_query('rates', filters)['bool']['filter'], list(filters))
@@ -1,6 +1,7 @@
 from django.urls import path
-from .views import search_news
+from .views import search_news, suggest_news
 
 urlpatterns = [
     path('news/search/', search_news, name='search_news'),
+    path('news/suggest/', suggest_news, name='suggest_news'),
 ]
@@ -1,10 +1,78 @@
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
-from .elasticsearch_client import es
+from django.conf import settings
+from elasticsearch import ConnectionTimeout, NotFoundError
+from core.es_client import get_es_client
+from .filters import build_news_query, build_suggest_body, filter_clauses, normalize_day, normalize_terms
+from .news_index import DATE_FACET, DATE_FACET_INTERVALS, FACET_FIELDS, SORT_FIELDS, facet_aggregations, parse_facets
+import base64
+import hashlib
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(pit_id, search_after, digest):
+    payload = json.dumps({"pit": pit_id, "after": search_after, "q": digest}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor, digest):
+    """
+    Point-in-time id and search_after values of a cursor
+
+    The cursor must belong to the same query, filters and sort.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        pit_id, search_after = payload["pit"], payload["after"]
+    except (ValueError, KeyError, TypeError):
+        raise InvalidCursor("Invalid cursor")
+    if payload.get("q") != digest:
+        raise InvalidCursor("Cursor does not match the query, filters or sort")
+    return pit_id, search_after
+
+
+def _page_size(value):
+    if value in (None, ""):
+        return settings.SEARCH_PAGE_SIZE
+    size = int(value)
+    if size < 1:
+        raise ValueError("size must be positive")
+    return min(size, settings.SEARCH_MAX_PAGE_SIZE)
+
+
+def _facet_names(value):
+    """
+    Requested facets: True for all of them, or a list of names
+    """
+    if value is True:
+        return list(FACET_FIELDS) + [DATE_FACET]
+    if not value:
+        return []
+    if not isinstance(value, list) or any(name not in FACET_FIELDS and name != DATE_FACET for name in value):
+        raise ValueError(f"facets must be true or a list of: {', '.join(list(FACET_FIELDS) + [DATE_FACET])}")
+    return value
+
 
 @api_view(['POST'])
 def search_news(request):
+    """
+    Search news articles, one page at a time
+
+    Pass the returned next_cursor back, with the same query, filters and
+    sort, to fetch the following page. Pages are read from a point-in-time
+    snapshot with search_after, so deep pages cost the same as the first.
+
+    With facets, the first page also returns value counts over the whole
+    filtered result set, from the same request.
+    """
     try:
         query = request.data.get('query', '')
         from_date = request.data.get('from_date', None)
@@ -13,54 +81,150 @@ def search_news(request):
         impact = request.data.get('impact', [])
         journals = request.data.get('journals', [])
         sort_by = request.data.get('sort_by', 'date')
+        sort_order = request.data.get('sort_order', 'desc')
+        cursor = request.data.get('cursor', None)
+        facet_interval = request.data.get('facet_interval', 'month')
+
+        if sort_by not in SORT_FIELDS:
+            return Response(
+                {"error": f"sort_by must be one of: {', '.join(SORT_FIELDS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if sort_order not in ('asc', 'desc'):
+            return Response({"error": "sort_order must be 'asc' or 'desc'"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            size = _page_size(request.data.get('size'))
+        except (TypeError, ValueError):
+            return Response({"error": "size must be a positive integer"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            facets = _facet_names(request.data.get('facets', False))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if facet_interval not in DATE_FACET_INTERVALS:
+            return Response(
+                {"error": f"facet_interval must be one of: {', '.join(DATE_FACET_INTERVALS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        es_query = {
-            "bool": {
-                "must": [],
-                "filter": []
-            }
+        try:
+            filters = filter_clauses(
+                normalize_day(from_date),
+                normalize_day(to_date),
+                normalize_terms(priority_level),
+                normalize_terms(impact),
+                normalize_terms(journals)
+            )
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        es_query = build_news_query(query, filters)
+
+        sort = [
+            {SORT_FIELDS[sort_by]: {"order": sort_order}},
+            # Tiebreaker so that search_after never skips or repeats hits
+            {"_shard_doc": "asc"}
+        ]
+        digest = hashlib.sha1(json.dumps([es_query, sort], sort_keys=True).encode("utf-8")).hexdigest()
+
+        es = get_es_client()
+        body = {
+            "query": es_query,
+            "sort": sort,
+            "size": size + 1,  # One extra hit tells whether another page exists
+            "_source": {"excludes": ["content_vector"]},
+            "track_total_hits": cursor is None
         }
+        # Facets cover the whole result set, so only the first page needs them
+        if facets and cursor is None:
+            body["aggs"] = facet_aggregations(
+                facets, terms_size=settings.SEARCH_FACET_SIZE, date_interval=facet_interval
+            )
 
-        if query:
-            es_query["bool"]["must"].append({
-                "multi_match": {
-                    "query": query,
-                    "fields": ["title^3", "content", "category.major", "src"],
-                    "type": "most_fields"
-                    # Search for full text
-                    # "type": "phrase"
-                }
-            })
-
-        if from_date and to_date:
-            es_query["bool"]["filter"].append({
-                "range": {"date": {"gte": from_date, "lte": to_date}}
-            })
-
-        if priority_level:
-            es_query["bool"]["filter"].append({"terms": {"priority_level.keyword": priority_level}})
-
-        if impact:
-            es_query["bool"]["filter"].append({"terms": {"impact.keyword": impact}})
-
-        if journals:
-            es_query["bool"]["filter"].append({"terms": {"src.keyword": journals}})
-
-        res = es.search(
-            index="news",
-            body={
-                "query": es_query,
-                "sort": [{sort_by: {"order": "desc"}}],
-                "_source": {"excludes": ["content_vector"]}
-            }
-        )
+        if cursor:
+            try:
+                pit_id, search_after = decode_cursor(cursor, digest)
+            except InvalidCursor as e:
+                return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            body["search_after"] = search_after
+        else:
+            pit_id = es.open_point_in_time(
+                index=settings.ES_INDEX_SEARCH_NEWS, keep_alive=settings.SEARCH_PIT_KEEP_ALIVE
+            )["id"]
 
+        body["pit"] = {"id": pit_id, "keep_alive": settings.SEARCH_PIT_KEEP_ALIVE}
+        try:
+            # Filters are normalized, so repeated pages and facets can hit the shard request cache
+            res = es.search(body=body, request_cache=True)
+        except NotFoundError:
+            return Response(
+                {"error": "Search cursor expired, start again without a cursor"},
+                status=status.HTTP_410_GONE
+            )
+
+        page = res["hits"]["hits"][:size]
         hits = [
             hit["_source"] | {"_id": hit["_id"], "_score": hit["_score"]}
-            for hit in res["hits"]["hits"]
+            for hit in page
         ]
 
-        return Response({"results": hits}, status=status.HTTP_200_OK)
+        # The point-in-time id may change between requests
+        pit_id = res.get("pit_id", pit_id)
+        if len(res["hits"]["hits"]) > size:
+            next_cursor = encode_cursor(pit_id, page[-1]["sort"], digest)
+        else:
+            next_cursor = None
+            try:
+                es.close_point_in_time(id=pit_id)
+            except Exception as e:
+                # It expires after its keep-alive anyway
+                logger.warning(f"Error closing point in time: {str(e)}")
+
+        data = {"results": hits, "next_cursor": next_cursor, "size": size}
+        if cursor is None:
+            data["total"] = res["hits"]["total"]
+            if facets:
+                data["facets"] = parse_facets(res.get("aggregations", {}))
+        return Response(data, status=status.HTTP_200_OK)
 
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+def suggest_news(request):
+    """
+    Title suggestions for a partially typed query
+
+    Runs within SEARCH_SUGGEST_BUDGET_MS: slow shards return partial
+    results, and a request that overruns returns no suggestions instead of
+    an error, so the UI can call this on every keystroke.
+    """
+    prefix = request.query_params.get('q', '').strip()[:100]
+    try:
+        size = min(int(request.query_params.get('size', settings.SEARCH_SUGGEST_SIZE)), settings.SEARCH_SUGGEST_MAX_SIZE)
+    except ValueError:
+        return Response({"error": "size must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+    if len(prefix) < settings.SEARCH_SUGGEST_MIN_CHARS or size < 1:
+        return Response({"suggestions": [], "timed_out": False}, status=status.HTTP_200_OK)
+
+    budget_ms = settings.SEARCH_SUGGEST_BUDGET_MS
+    # Shards stop early enough for the response to make it back within budget
+    body = build_suggest_body(prefix, size, budget_ms * 0.8)
+    es = get_es_client().options(request_timeout=budget_ms / 1000.0, max_retries=0)
+
+    try:
+        res = es.search(index=settings.ES_INDEX_SEARCH_NEWS, body=body, request_cache=True)
+    except ConnectionTimeout:
+        logger.warning(f"Suggestions for '{prefix}' exceeded {budget_ms}ms budget")
+        return Response({"suggestions": [], "timed_out": True}, status=status.HTTP_200_OK)
+    except Exception as e:
+        logger.error(f"Error fetching suggestions: {str(e)}")
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    suggestions = []
+    for hit in res["hits"]["hits"]:
+        title = hit["_source"].get("title")
+        if title and title not in suggestions:
+            suggestions.append(title)
+
+    return Response({"suggestions": suggestions, "timed_out": res.get("timed_out", False)}, status=status.HTTP_200_OK)
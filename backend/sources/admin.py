@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import DataSource, Document, UploadedFile
+from .models import DataSource, Document, IngestionCheckpoint, UploadedFile
 
 
 @admin.register(DataSource)
@@ -25,3 +25,10 @@ class UploadedFileAdmin(admin.ModelAdmin):
     search_fields = ['filename', 'user__username']
     readonly_fields = ['created_at']
 
+
+@admin.register(IngestionCheckpoint)
+class IngestionCheckpointAdmin(admin.ModelAdmin):
+    list_display = ['file_path', 'source', 'line_number', 'completed', 'updated_at']
+    list_filter = ['source', 'completed']
+    search_fields = ['file_path']
+    readonly_fields = ['updated_at']
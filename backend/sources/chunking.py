@@ -0,0 +1,93 @@
+"""
+Sentence-aware chunking of documents for indexing
+"""
+
+import itertools
+import re
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+def split_sentences(text):
+    return [sentence for sentence in _SENTENCE_END.split(text.strip()) if sentence]
+
+
+def _split_long_sentence(sentence, max_words):
+    words = sentence.split()
+    return [' '.join(words[i:i + max_words]) for i in range(0, len(words), max_words)]
+
+
+def chunk_text(text, max_words=150, overlap_words=30):
+    """
+    Split text into windows of whole sentences
+
+    Each chunk holds at most max_words words and starts with the trailing
+    sentences of the previous chunk, up to overlap_words words, so that
+    passages spanning a boundary are retrievable from either side.
+    Sentences longer than max_words are split on word boundaries.
+    """
+    sentences = []
+    for sentence in split_sentences(text):
+        if len(sentence.split()) > max_words:
+            sentences.extend(_split_long_sentence(sentence, max_words))
+        else:
+            sentences.append(sentence)
+
+    chunks = []
+    window = []
+    window_words = 0
+
+    for sentence in sentences:
+        words = len(sentence.split())
+
+        if window and window_words + words > max_words:
+            chunks.append(' '.join(window))
+
+            # Carry trailing sentences over as overlap
+            overlap = []
+            overlap_count = 0
+            for previous in reversed(window):
+                count = len(previous.split())
+                if overlap_count + count > overlap_words or overlap_count + count + words > max_words:
+                    break
+                overlap.insert(0, previous)
+                overlap_count += count
+            window = overlap
+            window_words = overlap_count
+
+        window.append(sentence)
+        window_words += words
+
+    if window:
+        chunks.append(' '.join(window))
+
+    return chunks
+
+
+def iter_paragraphs(lines, min_length=0, max_length=None):
+    """
+    Lazily yield the blank-line separated paragraphs of an iterable of lines
+
+    Lines within a paragraph are joined with single spaces. Paragraphs of
+    min_length characters or fewer are skipped and longer ones are cut at
+    max_length, without buffering more than max_length characters.
+    """
+    paragraph = []
+    buffered = 0
+    length = 0
+
+    for line in itertools.chain(lines, ['']):
+        line = line.strip()
+        if line:
+            if max_length is None or buffered < max_length:
+                paragraph.append(line)
+                buffered += len(line) + 1
+            length += len(line) + 1
+            continue
+
+        if paragraph and length - 1 > min_length:
+            text = ' '.join(paragraph)
+            yield text[:max_length] if max_length is not None else text
+        paragraph = []
+        buffered = 0
+        length = 0
@@ -2,12 +2,108 @@
 Elasticsearch service for indexing and searching documents
 """
 
-from elasticsearch import Elasticsearch
 from django.conf import settings
+from core.es_client import get_async_es_client, get_es_client
+from core.loop_local import LoopLocal
+from .search_cache import get_search_cache, query_hash
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
+RRF_RANK_CONSTANT = 60
+
+
+def _text_search_body(query, size):
+    return {
+        "query": {
+            "multi_match": {
+                "query": query,
+                "fields": ["title^2", "text"]
+            }
+        },
+        "size": size
+    }
+
+
+def _vector_search_body(query_vector, size):
+    return {
+        "knn": {
+            "field": "embedding",
+            "query_vector": query_vector,
+            "k": size,
+            "num_candidates": size * 10
+        }
+    }
+
+
+def parent_key(hit):
+    """
+    Identity used to de-duplicate hits: the parent of a chunk, else its source
+    """
+    source = hit.get('_source', {})
+    return source.get('parent_id') or source.get('source_id') or hit.get('_id')
+
+
+def collapse_to_parents(hits, size=None):
+    """
+    Keep only the best-ranked chunk of each parent document
+    """
+    collapsed = []
+    seen = set()
+    for hit in hits:
+        key = parent_key(hit)
+        if key in seen:
+            continue
+        seen.add(key)
+        collapsed.append(hit)
+    return collapsed[:size] if size is not None else collapsed
+
+
+def reciprocal_rank_fusion(result_lists, k=RRF_RANK_CONSTANT, size=10):
+    """
+    Fuse ranked hit lists with reciprocal rank fusion
+    
+    Each hit scores sum(1 / (k + rank)) over the lists it appears in, so
+    BM25 and kNN scores never need to be on the same scale. Chunks of the
+    same parent (or hits sharing a source_id) count once per list, at
+    their best rank. Fused scores are normalized to 0-1 by the best
+    possible score.
+    """
+    scores = {}
+    hits = {}
+    
+    for results in result_lists:
+        seen = set()
+        for rank, hit in enumerate(results, 1):
+            key = parent_key(hit)
+            if key in seen:
+                continue
+            seen.add(key)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            hits.setdefault(key, hit)
+    
+    best_possible = len(result_lists) / (k + 1)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:size]
+    return [dict(hits[key], _score=round(scores[key] / best_possible, 6)) for key in ranked]
+
+
+def _fuse_hybrid_results(text_hits, vector_hits, size):
+    """
+    Fuse BM25 and kNN results, tolerating one of them failing
+    """
+    result_lists = []
+    for name, hits in (('Text', text_hits), ('Vector', vector_hits)):
+        if isinstance(hits, Exception):
+            logger.warning(f"{name} retrieval failed in hybrid search: {str(hits)}")
+        else:
+            result_lists.append(hits)
+    
+    if not result_lists:
+        raise text_hits
+    return reciprocal_rank_fusion(result_lists, size=size)
+
 
 class ElasticsearchService:
     """
@@ -15,9 +111,22 @@ class ElasticsearchService:
     """
     
     def __init__(self):
-        self.es = Elasticsearch([settings.ES_HOST])
+        self._es = None
         self.news_index = settings.ES_INDEX_NEWS
         self.docs_index = settings.ES_INDEX_DOCS
+        self.result_cache = get_search_cache()
+        self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='es-search')
+    
+    @property
+    def es(self):
+        """
+        The shared client, looked up per use so forked workers get their own
+        """
+        return self._es if self._es is not None else get_es_client()
+    
+    @es.setter
+    def es(self, client):
+        self._es = client
     
     def create_index(self, index_name, mapping=None):
         """
@@ -53,6 +162,8 @@ class ElasticsearchService:
                     },
                     "source": {"type": "keyword"},
                     "source_id": {"type": "keyword"},
+                    "parent_id": {"type": "keyword"},
+                    "chunk_index": {"type": "integer"},
                     "timestamp": {"type": "date"},
                     "metadata": {"type": "object", "enabled": False}
                 }
@@ -69,6 +180,7 @@ class ElasticsearchService:
                 id=doc_id,
                 body=document
             )
+            self._invalidate(index_name)
             return response
         except Exception as e:
             logger.error(f"Error indexing document {doc_id}: {str(e)}")
@@ -77,6 +189,9 @@ class ElasticsearchService:
     def bulk_index(self, index_name, documents):
         """
         Bulk index multiple documents
+        
+        The optional 'id' key of each document is used as the document ID
+        and is not stored in the source.
         """
         from elasticsearch.helpers import bulk
         
@@ -84,13 +199,14 @@ class ElasticsearchService:
             {
                 "_index": index_name,
                 "_id": doc.get('id'),
-                "_source": doc
+                "_source": {k: v for k, v in doc.items() if k != 'id'}
             }
             for doc in documents
         ]
         
         try:
             success, errors = bulk(self.es, actions)
+            self._invalidate(index_name)
             logger.info(f"Bulk indexed {success} documents")
             if errors:
                 logger.error(f"Bulk index errors: {errors}")
@@ -103,19 +219,10 @@ class ElasticsearchService:
         """
         Full-text search
         """
-        body = {
-            "query": {
-                "multi_match": {
-                    "query": query,
-                    "fields": ["title^2", "text"]
-                }
-            },
-            "size": size
-        }
+        body = _text_search_body(query, size)
         
         try:
-            response = self.es.search(index=index_name, body=body)
-            return response['hits']['hits']
+            return self._search(index_name, body, 'text', query_hash(query), size)
         except Exception as e:
             logger.error(f"Error searching text: {str(e)}")
             raise
@@ -124,51 +231,38 @@ class ElasticsearchService:
         """
         Vector similarity search (kNN)
         """
-        body = {
-            "knn": {
-                "field": "embedding",
-                "query_vector": query_vector,
-                "k": size,
-                "num_candidates": size * 10
-            }
-        }
+        body = _vector_search_body(query_vector, size)
         
         try:
-            response = self.es.search(index=index_name, body=body)
-            return response['hits']['hits']
+            return self._search(index_name, body, 'vector', query_hash(query_vector), size)
         except Exception as e:
             logger.error(f"Error searching vector: {str(e)}")
             raise
     
-    def hybrid_search(self, index_name, query_text, query_vector, size=10):
-        """
-        Hybrid search combining text and vector search
-        """
-        body = {
-            "query": {
-                "bool": {
-                    "should": [
-                        {
-                            "multi_match": {
-                                "query": query_text,
-                                "fields": ["title^2", "text"]
-                            }
-                        }
-                    ]
-                }
-            },
-            "knn": {
-                "field": "embedding",
-                "query_vector": query_vector,
-                "k": size,
-                "num_candidates": size * 10
-            },
-            "size": size
-        }
+    def hybrid_search(self, index_name, query_text, query_vector, size=10, window=None, vector_store=None):
+        """
+        Hybrid search fusing BM25 and kNN results with reciprocal rank fusion
+        
+        Both searches run concurrently and fetch `window` candidates
+        (default 4 * size) before fusion. The kNN side runs against
+        vector_store when one is given, else against the index itself.
+        """
+        window = window or size * 4
+        text_future = self._executor.submit(self.search_text, index_name, query_text, window)
+        if vector_store is not None:
+            vector_future = self._executor.submit(vector_store.search, query_vector, window)
+        else:
+            vector_future = self._executor.submit(self.search_vector, index_name, query_vector, window)
+        
+        results = []
+        for future in (text_future, vector_future):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
         
         try:
-            response = self.es.search(index=index_name, body=body)
-            return response['hits']['hits']
+            return _fuse_hybrid_results(*results, size)
         except Exception as e:
             logger.error(f"Error hybrid search: {str(e)}")
             raise
@@ -179,11 +273,35 @@ class ElasticsearchService:
         """
         try:
             response = self.es.delete(index=index_name, id=doc_id)
+            self._invalidate(index_name)
             return response
         except Exception as e:
             logger.error(f"Error deleting document {doc_id}: {str(e)}")
             raise
     
+    def _search(self, index_name, body, query_type, digest, size):
+        """
+        Run a search, serving repeated queries from the result cache
+        """
+        key = None
+        generation = self.result_cache.generation(index_name) if self.result_cache is not None else None
+        if generation is not None:
+            key = self.result_cache.make_key(index_name, query_type, digest, size, generation)
+            hits = self.result_cache.get(key)
+            if hits is not None:
+                return hits
+        
+        response = self.es.search(index=index_name, body=body)
+        hits = response['hits']['hits']
+        
+        if key is not None:
+            self.result_cache.put(key, hits)
+        return hits
+    
+    def _invalidate(self, index_name):
+        if self.result_cache is not None:
+            self.result_cache.bump_generation(index_name)
+    
     def check_connection(self):
         """
         Check if Elasticsearch is connected
@@ -195,6 +313,98 @@ class ElasticsearchService:
             return False
 
 
+class AsyncElasticsearchService:
+    """
+    Async variant of ElasticsearchService for ASGI views
+    
+    Only the read paths used by the copilot are provided.
+    """
+    
+    def __init__(self):
+        self.es = get_async_es_client()
+        self.news_index = settings.ES_INDEX_NEWS
+        self.docs_index = settings.ES_INDEX_DOCS
+        self.result_cache = get_search_cache()
+    
+    async def search_text(self, index_name, query, size=10):
+        """
+        Full-text search
+        """
+        try:
+            return await self._search(
+                index_name, _text_search_body(query, size), 'text', query_hash(query), size
+            )
+        except Exception as e:
+            logger.error(f"Error searching text: {str(e)}")
+            raise
+    
+    async def search_vector(self, index_name, query_vector, size=10):
+        """
+        Vector similarity search (kNN)
+        """
+        try:
+            return await self._search(
+                index_name, _vector_search_body(query_vector, size), 'vector', query_hash(query_vector), size
+            )
+        except Exception as e:
+            logger.error(f"Error searching vector: {str(e)}")
+            raise
+    
+    async def hybrid_search(self, index_name, query_text, query_vector, size=10, window=None, vector_store=None):
+        """
+        Hybrid search fusing BM25 and kNN results with reciprocal rank fusion
+        """
+        window = window or size * 4
+        if vector_store is not None:
+            vector_search = vector_store.asearch(query_vector, window)
+        else:
+            vector_search = self.search_vector(index_name, query_vector, window)
+        
+        results = await asyncio.gather(
+            self.search_text(index_name, query_text, window),
+            vector_search,
+            return_exceptions=True
+        )
+        
+        try:
+            return _fuse_hybrid_results(*results, size)
+        except Exception as e:
+            logger.error(f"Error hybrid search: {str(e)}")
+            raise
+    
+    async def _search(self, index_name, body, query_type, digest, size):
+        """
+        Run a search, serving repeated queries from the result cache
+        """
+        key = None
+        generation = await self.result_cache.ageneration(index_name) if self.result_cache is not None else None
+        if generation is not None:
+            key = self.result_cache.make_key(index_name, query_type, digest, size, generation)
+            hits = self.result_cache.get(key)
+            if hits is not None:
+                return hits
+        
+        response = await self.es.search(index=index_name, body=body)
+        hits = response['hits']['hits']
+        
+        if key is not None:
+            self.result_cache.put(key, hits)
+        return hits
+    
+    async def check_connection(self):
+        """
+        Check if Elasticsearch is connected
+        """
+        try:
+            return await self.es.ping()
+        except Exception as e:
+            logger.error(f"Elasticsearch connection check failed: {str(e)}")
+            return False
+    
+    async def close(self):
+        await self.es.close()
+
+
 # Singleton instance
 _es_service = None
 
@@ -207,3 +417,13 @@ def get_elasticsearch_service():
         _es_service = ElasticsearchService()
     return _es_service
 
+
+# One async service per event loop, since its client is bound to the
+# loop; the client itself is closed with the loop by core.es_client
+_async_es_services = LoopLocal(AsyncElasticsearchService)
+
+def get_async_elasticsearch_service():
+    """
+    Get the async Elasticsearch service for the running event loop
+    """
+    return _async_es_services.get()
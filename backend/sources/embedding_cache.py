@@ -0,0 +1,286 @@
+"""
+Two-tier embedding cache: in-process LRU plus a memory-mapped disk store
+"""
+
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import threading
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process locking only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+KEY_SIZE = 20  # SHA-1 digest length
+EMPTY_KEY = bytes(KEY_SIZE)
+
+
+def cache_key(namespace, text):
+    """
+    Cache key for a text under a model namespace
+
+    Whitespace is normalized so trivially different inputs share an entry.
+    """
+    normalized = ' '.join(text.split())
+    return hashlib.sha1(f"{namespace}\0{normalized}".encode('utf-8')).digest()
+
+
+class LRUEmbeddingCache:
+    """
+    Bounded in-process cache of embedding vectors
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+            return vector
+
+    def put(self, key, vector):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DiskEmbeddingStore:
+    """
+    Persistent float32 matrix of embeddings with a hash index
+
+    Rows are written as a ring buffer: once capacity is reached the
+    oldest row is overwritten. The files are memory-mapped and shared,
+    so rows written by one process are visible to the others.
+    """
+
+    def __init__(self, directory, dimension, capacity):
+        self.directory = directory
+        self.dimension = dimension
+        self.capacity = capacity
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._index = {}
+        self._seen = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._lock_path = os.path.join(directory, 'store.lock')
+
+        with self._file_lock():
+            self._open()
+
+    def _file_lock(self):
+        return FileLock(self._lock_path)
+
+    def _files(self):
+        """
+        (attribute, file name, dtype, shape) of each memory-mapped file
+        """
+        return [
+            ('_vectors', 'vectors.f32', np.float32, (self.capacity, self.dimension)),
+            ('_keys', 'keys.bin', np.uint8, (self.capacity, KEY_SIZE)),
+            ('_head', 'head.u64', np.uint64, (1,)),
+        ]
+
+    def _open(self):
+        meta_path = os.path.join(self.directory, 'meta.json')
+        meta = {'dimension': self.dimension, 'capacity': self.capacity}
+
+        stored = None
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                stored = json.load(f)
+        if stored != meta:
+            self._create(meta_path, meta)
+
+        for attr, name, dtype, shape in self._files():
+            setattr(self, attr, np.memmap(os.path.join(self.directory, name), dtype=dtype, mode='r+', shape=shape))
+
+        self._refresh()
+
+    def _create(self, meta_path, meta):
+        """
+        Write empty files and rename them over any existing ones
+
+        Other processes may still map the old files. Truncating those in
+        place could kill them with SIGBUS, while a replaced file lives on
+        until it is unmapped.
+        """
+        for _, name, dtype, shape in self._files():
+            path = os.path.join(self.directory, name)
+            with open(path + '.tmp', 'wb') as f:
+                f.truncate(int(np.prod(shape)) * np.dtype(dtype).itemsize)
+            os.replace(path + '.tmp', path)
+
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+        logger.info(f"Initialized embedding store at {self.directory}")
+
+    def _refresh(self):
+        """
+        Index rows written since the last refresh, possibly by other processes
+        """
+        head = int(self._head[0])
+        start = max(self._seen, head - self.capacity)
+
+        for position in range(start, head):
+            row = position % self.capacity
+            key = self._keys[row].tobytes()
+            if key != EMPTY_KEY:
+                self._index[key] = row
+
+        self._seen = head
+
+    def get(self, key):
+        with self._lock:
+            row = self._index.get(key)
+            if row is None and int(self._head[0]) != self._seen:
+                self._refresh()
+                row = self._index.get(key)
+
+            if row is None or self._keys[row].tobytes() != key:
+                return None
+
+            # Another process may be overwriting the row; writers clear
+            # the key first, so an unchanged key means the copy is intact
+            vector = np.array(self._vectors[row])
+            if self._keys[row].tobytes() != key:
+                self._index.pop(key, None)
+                return None
+            return vector
+
+    def put_many(self, items):
+        """
+        Append (key, vector) pairs, evicting the oldest rows when full
+        """
+        with self._lock, self._file_lock():
+            self._refresh()
+            head = int(self._head[0])
+            for key, vector in items:
+                row = head % self.capacity
+                old_key = self._keys[row].tobytes()
+                if old_key != EMPTY_KEY:
+                    self._index.pop(old_key, None)
+                    self.evictions += 1
+
+                # Clear the key while the vector is replaced, see get()
+                self._keys[row] = 0
+                self._vectors[row] = vector
+                self._keys[row] = np.frombuffer(key, dtype=np.uint8)
+                self._index[key] = row
+                head += 1
+
+            self._head[0] = head
+            self._seen = head
+
+    def __len__(self):
+        return len(self._index)
+
+
+class FileLock:
+    """
+    Exclusive advisory lock on a file, a no-op where fcntl is unavailable
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._file = open(self.path, 'a')
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+class EmbeddingCache:
+    """
+    Looks embeddings up in memory first, then on disk
+
+    Keys combine the model namespace with a hash of the normalized text.
+    """
+
+    def __init__(self, namespace, max_entries, directory=None, dimension=None, capacity=0):
+        self.namespace = namespace
+        self.memory = LRUEmbeddingCache(max_entries)
+        self.disk = None
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if directory and capacity > 0:
+            try:
+                self.disk = DiskEmbeddingStore(directory, dimension, capacity)
+            except OSError as e:
+                logger.warning(f"Embedding disk cache unavailable: {str(e)}")
+
+    def get_many(self, texts):
+        """
+        Return a list of cached vectors, with None for misses
+        """
+        vectors = []
+        for text in texts:
+            key = cache_key(self.namespace, text)
+            vector = self.memory.get(key)
+
+            if vector is not None:
+                self.memory_hits += 1
+            elif self.disk is not None and (vector := self.disk.get(key)) is not None:
+                self.disk_hits += 1
+                self.memory.put(key, vector)
+            else:
+                self.misses += 1
+
+            vectors.append(vector)
+        return vectors
+
+    def put_many(self, texts, vectors):
+        items = [
+            (cache_key(self.namespace, text), np.asarray(vector, dtype=np.float32))
+            for text, vector in zip(texts, vectors)
+        ]
+        for key, vector in items:
+            self.memory.put(key, vector)
+        if self.disk is not None:
+            self.disk.put_many(items)
+
+    def stats(self):
+        """
+        Hit/miss and eviction counters
+        """
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            'memory_entries': len(self.memory),
+            'memory_evictions': self.memory.evictions,
+            'disk_entries': len(self.disk) if self.disk is not None else 0,
+            'disk_evictions': self.disk.evictions if self.disk is not None else 0,
+        }
@@ -0,0 +1,229 @@
+"""
+Local embedding server with dynamic request batching
+
+One process loads the model and serves embed requests from all gunicorn
+workers over a Unix socket. Concurrent requests are merged into
+micro-batches bounded by a maximum batch size and a maximum wait time.
+"""
+
+from sources.embedding_service import EmbeddingService
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct('!I')
+
+
+def send_message(sock, header, payload=b''):
+    """
+    Send a length-prefixed JSON header followed by a raw payload
+    """
+    header = dict(header, payload_bytes=len(payload))
+    data = json.dumps(header).encode('utf-8')
+    sock.sendall(_HEADER.pack(len(data)) + data + payload)
+
+
+def recv_message(sock):
+    """
+    Receive a message sent by send_message, returning (header, payload)
+    """
+    (length,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    header = json.loads(_recv_exact(sock, length))
+    payload = _recv_exact(sock, header.get('payload_bytes', 0))
+    return header, payload
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Embedding server connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+class _PendingRequest:
+    def __init__(self, texts):
+        self.texts = texts
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class EmbeddingBatcher:
+    """
+    Collects concurrent embed requests into micro-batches
+    """
+
+    def __init__(self, embedding_service, max_batch_size=64, max_wait_ms=5):
+        self.embedding_service = embedding_service
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.batches = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='embedding-batcher', daemon=True)
+        self._thread.start()
+
+    def submit(self, texts):
+        """
+        Embed texts as part of the next batch, blocking until done
+        """
+        request = _PendingRequest(texts)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        size = len(batch[0].texts)
+        deadline = time.monotonic() + self.max_wait
+
+        while size < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for request in batch for text in request.texts]
+
+            try:
+                vectors = self.embedding_service.embed_batch_array(
+                    texts,
+                    batch_size=self.max_batch_size,
+                    show_progress_bar=False
+                )
+                offset = 0
+                for request in batch:
+                    request.result = vectors[offset:offset + len(request.texts)]
+                    offset += len(request.texts)
+            except Exception as e:
+                logger.error(f"Error embedding batch of {len(texts)} texts: {str(e)}")
+                for request in batch:
+                    request.error = e
+
+            self.batches += 1
+            for request in batch:
+                request.done.set()
+
+
+class _EmbeddingRequestHandler(socketserver.BaseRequestHandler):
+    """
+    Serves embed requests on a persistent client connection
+    """
+
+    def handle(self):
+        while True:
+            try:
+                header, _ = recv_message(self.request)
+            except (ConnectionError, OSError):
+                return
+
+            try:
+                vectors = self.server.batcher.submit(header['texts'])
+                send_message(
+                    self.request,
+                    {'shape': list(vectors.shape), 'dtype': 'float32'},
+                    vectors.tobytes()
+                )
+            except Exception as e:
+                send_message(self.request, {'error': str(e)})
+
+
+class EmbeddingServer(socketserver.ThreadingUnixStreamServer):
+    """
+    Unix socket server sharing one model across all clients
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, embedding_service=None, max_batch_size=64, max_wait_ms=5):
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        self.batcher = EmbeddingBatcher(
+            embedding_service or EmbeddingService(),
+            max_batch_size=max_batch_size,
+            max_wait_ms=max_wait_ms
+        )
+        super().__init__(socket_path, _EmbeddingRequestHandler)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+class RemoteEmbeddingService(EmbeddingService):
+    """
+    EmbeddingService that encodes through the local embedding server
+
+    Falls back to loading the model in-process while the server is
+    unreachable. Caching is left to the server, so that each miss is
+    written to the shared disk cache once.
+    """
+
+    RETRY_AFTER = 30  # Seconds before retrying an unreachable server
+
+    def __init__(self, socket_path, timeout=30):
+        super().__init__()
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._unavailable_until = 0.0
+
+    def _connection(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+        return sock
+
+    def _build_cache(self):
+        return None
+
+    def _close_connection(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            sock.close()
+            self._local.sock = None
+
+    def _encode(self, texts, batch_size=32, show_progress_bar=False):
+        if time.monotonic() >= self._unavailable_until:
+            try:
+                sock = self._connection()
+                send_message(sock, {'texts': list(texts)})
+                header, payload = recv_message(sock)
+            except (ConnectionError, OSError) as e:
+                self._close_connection()
+                self._unavailable_until = time.monotonic() + self.RETRY_AFTER
+                logger.warning(f"Embedding server unavailable, encoding locally: {str(e)}")
+            else:
+                if 'error' in header:
+                    raise RuntimeError(f"Embedding server error: {header['error']}")
+                return np.frombuffer(payload, dtype=np.float32).reshape(header['shape'])
+
+        return super()._encode(texts, batch_size, show_progress_bar)
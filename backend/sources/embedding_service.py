@@ -4,7 +4,9 @@ Embedding service using sentence-transformers
 
 from sentence_transformers import SentenceTransformer
 from django.conf import settings
+from sources.embedding_cache import EmbeddingCache
 import logging
+import os
 import numpy as np
 
 logger = logging.getLogger(__name__)
@@ -13,12 +15,63 @@ logger = logging.getLogger(__name__)
 class EmbeddingService:
     """
     Service for generating embeddings using sentence-transformers
+    
+    The model runs on PyTorch by default. With EMBEDDING_BACKEND='onnx'
+    it runs an exported ONNX (optionally int8-quantized) version of the
+    same model through onnxruntime.
     """
     
+    BACKENDS = ('torch', 'onnx')
+    
     def __init__(self):
         self.model = None
         self.model_name = settings.EMBEDDING_MODEL
         self.dimension = settings.EMBEDDING_DIMENSION
+        self.backend = settings.EMBEDDING_BACKEND
+        self.onnx_file = settings.EMBEDDING_ONNX_FILE
+        if self.backend not in self.BACKENDS:
+            raise ValueError(f"Unknown embedding backend: {self.backend}")
+        self.cache = self._build_cache()
+    
+    @property
+    def cache_namespace(self):
+        """
+        Cache namespace; vectors from different backends are kept apart
+        """
+        if self.backend == 'torch':
+            return self.model_name
+        return f"{self.model_name}|{self.backend}|{self.onnx_file}"
+    
+    def _build_cache(self):
+        """
+        Build the two-tier embedding cache configured in settings
+        """
+        if not settings.EMBEDDING_CACHE_ENABLED:
+            return None
+        
+        directory = None
+        if settings.EMBEDDING_CACHE_DIR:
+            directory = os.path.join(str(settings.EMBEDDING_CACHE_DIR), self.model_name.replace('/', '__'))
+        
+        return EmbeddingCache(
+            namespace=self.cache_namespace,
+            max_entries=settings.EMBEDDING_CACHE_SIZE,
+            directory=directory,
+            dimension=self.dimension,
+            capacity=settings.EMBEDDING_CACHE_DISK_CAPACITY
+        )
+    
+    def _load_transformer(self, backend):
+        """
+        Instantiate the model on the given backend
+        """
+        if backend == 'torch':
+            return SentenceTransformer(self.model_name)
+        
+        model_kwargs = {'provider': 'CPUExecutionProvider'}
+        if self.onnx_file:
+            model_kwargs['file_name'] = self.onnx_file
+        return SentenceTransformer(self.model_name, backend=backend, model_kwargs=model_kwargs)
     
     def load_model(self):
         """
@@ -26,50 +79,154 @@ class EmbeddingService:
         """
         if self.model is None:
             try:
-                logger.info(f"Loading embedding model: {self.model_name}")
-                self.model = SentenceTransformer(self.model_name)
+                logger.info(f"Loading embedding model: {self.model_name} ({self.backend})")
+                self.model = self._load_transformer(self.backend)
                 logger.info("Embedding model loaded successfully")
             except Exception as e:
                 logger.error(f"Error loading embedding model: {str(e)}")
                 raise
     
-    def embed_text(self, text):
+    def _encode(self, texts, batch_size=32, show_progress_bar=False):
         """
-        Generate embedding for a single text
+        Run the model on texts, returning a float32 matrix
         """
         self.load_model()
+        embeddings = self.model.encode(
+            texts,
+            batch_size=batch_size,
+            convert_to_numpy=True,
+            show_progress_bar=show_progress_bar
+        )
+        return embeddings.astype(np.float32, copy=False)
+    
+    def _embed(self, texts, batch_size=32, show_progress_bar=False):
+        """
+        Embed texts, only running the model for cache misses
+        """
+        if self.cache is None:
+            return self._encode(texts, batch_size, show_progress_bar)
+        
+        vectors = self.cache.get_many(texts)
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        
+        if missing:
+            missing_texts = [texts[i] for i in missing]
+            encoded = self._encode(missing_texts, batch_size, show_progress_bar)
+            self.cache.put_many(missing_texts, encoded)
+            for i, vector in zip(missing, encoded):
+                vectors[i] = vector
+        
+        return np.vstack(vectors)
+    
+    def embed_text_array(self, text):
+        """
+        Generate embedding for a single text as a float32 array
+        """
         try:
-            embedding = self.model.encode(text, convert_to_numpy=True)
-            return embedding.tolist()
+            return self._embed([text])[0]
         except Exception as e:
             logger.error(f"Error generating embedding: {str(e)}")
             raise
     
-    def embed_batch(self, texts, batch_size=32):
+    def embed_batch_array(self, texts, batch_size=32, show_progress_bar=True):
         """
-        Generate embeddings for multiple texts
+        Generate embeddings for multiple texts as a float32 matrix
         """
-        self.load_model()
+        if not len(texts):
+            return np.empty((0, self.dimension), dtype=np.float32)
         try:
-            embeddings = self.model.encode(
-                texts,
-                batch_size=batch_size,
-                convert_to_numpy=True,
-                show_progress_bar=True
-            )
-            return embeddings.tolist()
+            return self._embed(list(texts), batch_size, show_progress_bar)
         except Exception as e:
             logger.error(f"Error generating batch embeddings: {str(e)}")
             raise
     
+    def embed_text(self, text):
+        """
+        Generate embedding for a single text
+        """
+        return self.embed_text_array(text).tolist()
+    
+    def embed_batch(self, texts, batch_size=32, show_progress_bar=True):
+        """
+        Generate embeddings for multiple texts
+        """
+        return self.embed_batch_array(texts, batch_size, show_progress_bar).tolist()
+    
+    def check_backend_parity(self, texts, tolerance=0.01):
+        """
+        Compare the configured backend against the PyTorch model
+        
+        Passes when every text's cosine similarity between the two
+        outputs is at least 1 - tolerance.
+        """
+        candidate = self._encode(texts)
+        reference = self._load_transformer('torch').encode(texts, convert_to_numpy=True).astype(np.float32)
+        
+        cosines = np.sum(candidate * reference, axis=1) / (
+            np.linalg.norm(candidate, axis=1) * np.linalg.norm(reference, axis=1)
+        )
+        min_cosine = float(cosines.min())
+        
+        return {
+            'backend': self.backend,
+            'onnx_file': self.onnx_file,
+            'min_cosine': min_cosine,
+            'mean_cosine': float(cosines.mean()),
+            'passed': min_cosine >= 1 - tolerance
+        }
+    
+    def cache_stats(self):
+        """
+        Embedding cache counters, or None when caching is disabled
+        """
+        return self.cache.stats() if self.cache is not None else None
+    
+    @staticmethod
+    def normalize(vectors):
+        """
+        Convert vectors to a float32 matrix of unit-length rows
+        """
+        matrix = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+    
+    def similarity_matrix(self, queries, candidates, normalized=False):
+        """
+        Cosine similarity of every query against every candidate
+        
+        Pass normalized=True when both inputs are already unit-length
+        float32 matrices to skip the normalization pass.
+        """
+        if normalized:
+            queries = np.atleast_2d(queries)
+            candidates = np.atleast_2d(candidates)
+        else:
+            queries = self.normalize(queries)
+            candidates = self.normalize(candidates)
+        return queries @ candidates.T
+    
+    def top_k(self, query, candidates, k=10, normalized=False):
+        """
+        Indices and scores of the k candidates most similar to query
+        
+        Returns a list of (index, score) tuples, best first.
+        """
+        scores = self.similarity_matrix(query, candidates, normalized)[0]
+        k = min(k, scores.shape[0])
+        if k <= 0:
+            return []
+        
+        indices = np.argpartition(-scores, k - 1)[:k]
+        indices = indices[np.argsort(-scores[indices])]
+        return [(int(i), float(scores[i])) for i in indices]
+    
     def similarity(self, embedding1, embedding2):
         """
         Calculate cosine similarity between two embeddings
         """
         try:
-            arr1 = np.array(embedding1)
-            arr2 = np.array(embedding2)
-            return np.dot(arr1, arr2) / (np.linalg.norm(arr1) * np.linalg.norm(arr2))
+            return float(self.similarity_matrix(embedding1, embedding2)[0, 0])
         except Exception as e:
             logger.error(f"Error calculating similarity: {str(e)}")
             raise
@@ -81,9 +238,18 @@ _embedding_service = None
 def get_embedding_service():
     """
     Get singleton embedding service instance
+    
+    Uses the local embedding server when EMBEDDING_SERVER_SOCKET is set.
     """
     global _embedding_service
     if _embedding_service is None:
-        _embedding_service = EmbeddingService()
+        if settings.EMBEDDING_SERVER_SOCKET:
+            from sources.embedding_server import RemoteEmbeddingService
+            _embedding_service = RemoteEmbeddingService(
+                settings.EMBEDDING_SERVER_SOCKET,
+                timeout=settings.EMBEDDING_SERVER_TIMEOUT
+            )
+        else:
+            _embedding_service = EmbeddingService()
     return _embedding_service
 
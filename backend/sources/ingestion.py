@@ -0,0 +1,344 @@
+"""
+Streaming, batched ingestion pipeline for news articles
+"""
+
+from django.conf import settings
+from sources.chunking import chunk_text
+from sources.models import Document, IngestionCheckpoint
+from itertools import islice
+import gzip
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(title, content):
+    """
+    Stable hash of an article's title and content
+
+    Unlike hash(), this does not change between processes, so it can be
+    used as a persistent document ID.
+    """
+    normalized = ' '.join(f"{title}\n{content}".split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def iter_news_articles(filepath, start_line=0):
+    """
+    Lazily yield articles from a JSONL.GZ file
+
+    Lines that are not valid JSON or have no title/content are skipped.
+    Each article carries the number of lines consumed up to and
+    including it, so ingestion can resume from start_line.
+    """
+    with gzip.open(filepath, 'rt', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if line_number <= start_line:
+                continue
+
+            try:
+                data = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+            title = data.get('title', '')
+            content = data.get('content', data.get('text', ''))
+
+            if not title or not content:
+                continue
+
+            yield {
+                'title': title,
+                'content': content,
+                'timestamp': data.get('date', data.get('published_at', '')),
+                'category': data.get('category', ''),
+                'line_number': line_number,
+            }
+
+
+def batched(iterable, batch_size):
+    """
+    Group an iterable into lists of at most batch_size items
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+class NewsIngestor:
+    """
+    Embeds, indexes and persists news articles in micro-batches
+
+    Articles are split into overlapping sentence-aware chunks, each
+    indexed as its own Elasticsearch document pointing at its parent.
+    With a vector store other than Elasticsearch, embeddings go to the
+    store and Elasticsearch only keeps the text for BM25.
+    """
+
+    def __init__(self, es_service, embedding_service, source, index_name=None, batch_size=64, resume=True,
+                 chunk_words=None, chunk_overlap_words=None, vector_store=None, reindex=False):
+        self.es_service = es_service
+        self.vector_store = vector_store
+        self.embedding_service = embedding_service
+        self.source = source
+        self.index_name = index_name or settings.ES_INDEX_NEWS
+        self.batch_size = batch_size
+        self.resume = resume and not reindex  # Reindexing re-reads every file
+        self.reindex = reindex
+        self.chunk_words = chunk_words or settings.INGEST_CHUNK_WORDS
+        self.chunk_overlap_words = (
+            chunk_overlap_words if chunk_overlap_words is not None else settings.INGEST_CHUNK_OVERLAP_WORDS
+        )
+
+    @staticmethod
+    def document_id(article):
+        """
+        Content-addressed document ID for an article
+        """
+        return f"news_{content_hash(article['title'], article['content'])[:32]}"
+
+    def chunk_article(self, article):
+        """
+        Split an article's content into overlapping chunks
+        """
+        return chunk_text(article['content'], self.chunk_words, self.chunk_overlap_words) or [article['content']]
+
+    def build_document(self, article, chunk_index, chunk, embedding):
+        """
+        Build the Elasticsearch document for one chunk of an article
+        """
+        parent_id = self.document_id(article)
+        return {
+            'id': f"{parent_id}_c{chunk_index}",
+            'parent_id': parent_id,
+            'chunk_index': chunk_index,
+            'title': article['title'],
+            'text': chunk,
+            'embedding': embedding,
+            'source': self.source.id,
+            'timestamp': article['timestamp'],
+            'metadata': {
+                'category': article['category'],
+                'source_name': self.source.name
+            }
+        }
+
+    def filter_new(self, articles):
+        """
+        Drop articles that are already indexed or repeated within the batch
+
+        Since IDs are content hashes, an existing Document means the
+        article is indexed and unchanged. With reindex, articles are
+        re-indexed regardless, e.g. after the indices were recreated.
+        """
+        unique = {}
+        for article in articles:
+            unique.setdefault(self.document_id(article), article)
+
+        if self.reindex:
+            return list(unique.values())
+
+        existing = set(
+            Document.objects.filter(elasticsearch_id__in=list(unique))
+            .values_list('elasticsearch_id', flat=True)
+        )
+
+        return [article for doc_id, article in unique.items() if doc_id not in existing]
+
+    def ingest_batch(self, articles):
+        """
+        Embed, bulk index and upsert the new articles of one batch
+
+        All chunks of the batch are embedded in one call. Returns the
+        number of articles indexed.
+        """
+        articles = self.filter_new(articles)
+        if not articles:
+            return 0
+
+        chunks = [
+            (article, chunk_index, chunk)
+            for article in articles
+            for chunk_index, chunk in enumerate(self.chunk_article(article))
+        ]
+
+        texts = [f"{article['title']} {chunk}" for article, _, chunk in chunks]
+        embeddings = self.embedding_service.embed_batch_array(
+            texts,
+            batch_size=self.batch_size,
+            show_progress_bar=False
+        )
+
+        docs = [
+            self.build_document(article, chunk_index, chunk, embedding)
+            for (article, chunk_index, chunk), embedding in zip(chunks, embeddings)
+        ]
+
+        if self.vector_store is not None and not self.vector_store.indexes_text:
+            self.vector_store.upsert(docs)
+            docs = [{k: v for k, v in doc.items() if k != 'embedding'} for doc in docs]
+
+        self.es_service.bulk_index(self.index_name, docs)
+
+        # One row per article, holding the full content
+        Document.objects.bulk_create(
+            [
+                Document(
+                    elasticsearch_id=self.document_id(article),
+                    source=self.source,
+                    title=article['title'][:500],
+                    content=article['content'],
+                    metadata={
+                        'category': article['category'],
+                        'source_name': self.source.name
+                    }
+                )
+                for article in articles
+            ],
+            update_conflicts=True,
+            unique_fields=['elasticsearch_id'],
+            update_fields=['source', 'title', 'content', 'metadata', 'updated_at']
+        )
+
+        return len(articles)
+
+    def get_checkpoint(self, filepath):
+        """
+        Get the checkpoint for a file, resetting it if the file changed
+        """
+        file_size = os.path.getsize(filepath)
+        checkpoint, created = IngestionCheckpoint.objects.get_or_create(
+            file_path=os.path.abspath(filepath),
+            defaults={'source': self.source, 'file_size': file_size}
+        )
+
+        if not self.resume or checkpoint.file_size != file_size:
+            checkpoint.file_size = file_size
+            checkpoint.line_number = 0
+            checkpoint.completed = False
+            checkpoint.save()
+
+        return checkpoint
+
+    def ingest_file(self, filepath, max_docs=None, on_batch=None, budget=None):
+        """
+        Stream a JSONL.GZ file through the pipeline
+
+        Ingestion resumes from the file's checkpoint, which only advances
+        while every batch so far has succeeded. An optional DocBudget caps
+        the documents loaded across files and worker processes.
+        Returns a stats dict with loaded, skipped, errors and elapsed
+        seconds.
+        """
+        stats = {'loaded': 0, 'skipped': 0, 'errors': 0, 'elapsed': 0.0}
+        started = time.perf_counter()
+
+        checkpoint = self.get_checkpoint(filepath)
+        if checkpoint.completed:
+            stats['elapsed'] = time.perf_counter() - started
+            return stats
+
+        articles = iter_news_articles(filepath, start_line=checkpoint.line_number)
+        if max_docs is not None:
+            articles = islice(articles, max_docs)
+
+        exhausted = True
+        failed = False
+
+        try:
+            for batch in batched(articles, self.batch_size):
+                if budget is not None:
+                    granted = budget.take(len(batch))
+                    if granted < len(batch):
+                        exhausted = False
+                    batch = batch[:granted]
+                    if not batch:
+                        break
+
+                try:
+                    loaded = self.ingest_batch(batch)
+                except Exception as e:
+                    logger.error(f"Error ingesting batch from {filepath}: {str(e)}")
+                    stats['errors'] += len(batch)
+                    failed = True
+                    continue
+
+                stats['loaded'] += loaded
+                stats['skipped'] += len(batch) - loaded
+                if budget is not None:
+                    # Unchanged documents don't count against the cap
+                    budget.release(len(batch) - loaded)
+
+                if not failed:
+                    checkpoint.line_number = batch[-1]['line_number']
+                    checkpoint.save(update_fields=['line_number', 'updated_at'])
+
+                if on_batch is not None:
+                    on_batch(stats['loaded'])
+        except (OSError, EOFError) as e:
+            logger.error(f"Error reading file {filepath}: {str(e)}")
+            stats['errors'] += 1
+            failed = True
+
+        if max_docs is not None and stats['loaded'] + stats['skipped'] + stats['errors'] >= max_docs:
+            exhausted = False
+
+        if exhausted and not failed:
+            checkpoint.completed = True
+            checkpoint.save(update_fields=['completed', 'updated_at'])
+
+        stats['elapsed'] = time.perf_counter() - started
+        return stats
+
+
+class DocBudget:
+    """
+    Document cap shared between ingestion processes
+
+    The counter is a multiprocessing.Value so that worker processes
+    can draw from the same budget. A limit of None is unlimited.
+    """
+
+    def __init__(self, limit, counter=None):
+        self.limit = limit
+        self.counter = counter if counter is not None else multiprocessing.Value('q', 0)
+
+    def take(self, count):
+        """
+        Reserve up to count documents, returning how many were granted
+        """
+        with self.counter.get_lock():
+            if self.limit is None:
+                granted = count
+            else:
+                granted = max(0, min(count, self.limit - self.counter.value))
+            self.counter.value += granted
+        return granted
+
+    def release(self, count):
+        """
+        Return reserved documents that turned out not to need loading
+        """
+        if count > 0:
+            with self.counter.get_lock():
+                self.counter.value -= count
+
+    @property
+    def exhausted(self):
+        return self.limit is not None and self.counter.value >= self.limit
+
+
+def format_throughput(count, elapsed):
+    """
+    Format a docs/sec throughput figure
+    """
+    rate = count / elapsed if elapsed > 0 else 0.0
+    return f"{count} docs in {elapsed:.1f}s ({rate:.1f} docs/sec)"
@@ -0,0 +1,83 @@
+"""
+Process pool entry points for parallel news ingestion
+
+This module must not import Django models at import time: spawned
+workers import it before django.setup() has run.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import multiprocessing
+import os
+
+# Per-process state, set up by _init_worker
+_ingestor = None
+_budget = None
+
+
+def _init_worker(source_id, index_name, batch_size, resume, reindex, budget_limit, budget_counter):
+    """
+    Set up Django and give the worker its own embedding model and ES client
+    """
+    import django
+    django.setup()
+
+    from sources.elasticsearch_service import ElasticsearchService
+    from sources.embedding_service import EmbeddingService
+    from sources.ingestion import DocBudget, NewsIngestor
+    from sources.models import DataSource
+    from sources.vector_store import get_vector_store
+
+    global _ingestor, _budget
+    _ingestor = NewsIngestor(
+        ElasticsearchService(),
+        EmbeddingService(),
+        DataSource.objects.get(id=source_id),
+        index_name=index_name,
+        batch_size=batch_size,
+        resume=resume,
+        reindex=reindex,
+        vector_store=get_vector_store(index_name)
+    )
+    _budget = DocBudget(budget_limit, budget_counter)
+
+
+def _ingest_file(filepath):
+    """
+    Ingest one file inside a worker process
+    """
+    stats = _ingestor.ingest_file(filepath, budget=_budget)
+    stats['file'] = filepath
+    stats['pid'] = os.getpid()
+    return stats
+
+
+def ingest_files_parallel(filepaths, source, workers, max_docs, index_name=None, batch_size=64, resume=True,
+                          reindex=False):
+    """
+    Spread files across a process pool, yielding per-file stats as they finish
+
+    Workers share a single document budget of max_docs, or none if None.
+    """
+    ctx = multiprocessing.get_context('spawn')
+    counter = ctx.Value('q', 0)
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=ctx,
+        initializer=_init_worker,
+        initargs=(source.id, index_name, batch_size, resume, reindex, max_docs, counter)
+    ) as pool:
+        futures = {pool.submit(_ingest_file, path): path for path in filepaths}
+
+        for future in as_completed(futures):
+            try:
+                yield future.result()
+            except Exception as e:
+                yield {
+                    'file': futures[future],
+                    'loaded': 0,
+                    'skipped': 0,
+                    'errors': 1,
+                    'elapsed': 0.0,
+                    'error': str(e)
+                }
@@ -0,0 +1,48 @@
+"""
+Management command to check the embedding backend against PyTorch
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from sources.embedding_service import EmbeddingService
+
+
+class Command(BaseCommand):
+    help = 'Check that the configured embedding backend matches the PyTorch model'
+
+    SAMPLE_TEXTS = [
+        'Online retail sales grew strongly in the fourth quarter.',
+        'Why did ROAS drop last week?',
+        'Customer retention is cheaper than acquisition.',
+        'Social media platforms are becoming shopping destinations.',
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.01,
+            help='Allowed drop in cosine similarity (default: 0.01)',
+        )
+        parser.add_argument(
+            '--text',
+            action='append',
+            dest='texts',
+            help='Text to compare (repeatable, defaults to built-in samples)',
+        )
+
+    def handle(self, *args, **options):
+        service = EmbeddingService()
+        texts = options['texts'] or self.SAMPLE_TEXTS
+        
+        result = service.check_backend_parity(texts, tolerance=options['tolerance'])
+        
+        self.stdout.write(
+            f"Backend: {result['backend']} {result['onnx_file']}\n"
+            f"Min cosine: {result['min_cosine']:.5f}\n"
+            f"Mean cosine: {result['mean_cosine']:.5f}"
+        )
+        
+        if not result['passed']:
+            raise CommandError(f"Backend output differs from PyTorch beyond tolerance {options['tolerance']}")
+        
+        self.stdout.write(self.style.SUCCESS('✓ Backend output matches PyTorch within tolerance'))
@@ -3,13 +3,16 @@ Management command to load news data into Elasticsearch
 """
 
 from django.core.management.base import BaseCommand
+from django.utils import timezone
 from sources.elasticsearch_service import get_elasticsearch_service
 from sources.embedding_service import get_embedding_service
+from sources.ingestion import DocBudget, NewsIngestor, format_throughput
+from sources.ingestion_workers import ingest_files_parallel
 from sources.models import DataSource, Document
+from sources.vector_store import get_vector_store
 from django.conf import settings
-import gzip
-import json
 import os
+import time
 
 
 class Command(BaseCommand):
@@ -27,10 +30,42 @@ class Command(BaseCommand):
             default='ahannews',
             help='Source directory name (default: ahannews)',
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=64,
+            help='Number of articles embedded and indexed per batch (default: 64)',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Number of worker processes, each loading its own files (default: 1)',
+        )
+        parser.add_argument(
+            '--max-docs',
+            type=int,
+            default=None,
+            help='Stop after loading this many new documents across all workers (default: unlimited, 50 with --sample)',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore saved checkpoints and re-read every file from the start',
+        )
+        parser.add_argument(
+            '--reindex',
+            action='store_true',
+            help='Re-read every file and index all articles, even those already loaded (implies --restart)',
+        )
 
     def handle(self, *args, **options):
         sample_mode = options['sample']
         source_name = options['source']
+        batch_size = max(1, options['batch_size'])
+        workers = max(1, options['workers'])
+        reindex = options['reindex']
+        resume = not (options['restart'] or reindex)
         
         self.stdout.write(f'Loading news data from {source_name}...')
         
@@ -48,6 +83,7 @@ class Command(BaseCommand):
         # Initialize services
         es_service = get_elasticsearch_service()
         embedding_service = get_embedding_service()
+        vector_store = get_vector_store()
         
         # Create Elasticsearch index
         try:
@@ -56,13 +92,17 @@ class Command(BaseCommand):
         except Exception as e:
             self.stdout.write(self.style.WARNING(f'Index may already exist: {str(e)}'))
         
+        if not vector_store.indexes_text:
+            vector_store.create(settings.EMBEDDING_DIMENSION)
+            self.stdout.write(self.style.SUCCESS(f'✓ Vector store ready ({settings.VECTOR_STORE_BACKEND})'))
+        
         # Find news files
         data_path = os.path.join(os.path.dirname(settings.BASE_DIR), 'data', 'TLPC_sample', source_name)
         
         if not os.path.exists(data_path):
             self.stdout.write(self.style.ERROR(f'✗ Data path not found: {data_path}'))
             self.stdout.write('Creating sample data instead...')
-            self.create_sample_data(es_service, embedding_service, source)
+            self.create_sample_data(es_service, embedding_service, source, vector_store)
             return
         
         # Load files
@@ -70,98 +110,91 @@ class Command(BaseCommand):
         
         if not files:
             self.stdout.write(self.style.WARNING('No JSONL.GZ files found. Creating sample data...'))
-            self.create_sample_data(es_service, embedding_service, source)
+            self.create_sample_data(es_service, embedding_service, source, vector_store)
             return
         
-        total_loaded = 0
-        max_docs = 50 if sample_mode else 1000
+        files = sorted(files)[:3 if sample_mode else None]  # Limit files in sample mode
+        max_docs = options['max_docs']
+        if max_docs is None and sample_mode:
+            max_docs = 50
+        started = time.perf_counter()
         
-        for filename in files[:3 if sample_mode else None]:  # Limit files in sample mode
-            filepath = os.path.join(data_path, filename)
-            loaded = self.load_file(filepath, es_service, embedding_service, source, max_docs - total_loaded)
-            total_loaded += loaded
+        if workers > 1:
+            total_loaded = self.load_files_parallel(
+                data_path, files, source, workers, max_docs, batch_size, resume, reindex
+            )
+        else:
+            total_loaded = 0
+            ingestor = NewsIngestor(
+                es_service, embedding_service, source,
+                batch_size=batch_size, resume=resume, vector_store=vector_store, reindex=reindex
+            )
+            budget = DocBudget(max_docs)
             
-            if total_loaded >= max_docs:
-                break
+            for filename in files:
+                filepath = os.path.join(data_path, filename)
+                total_loaded += self.load_file(filepath, ingestor, budget)
+                
+                if budget.exhausted:
+                    break
         
+        vector_store.build_index()
+        elapsed = time.perf_counter() - started
         self.stdout.write(
             self.style.SUCCESS(f'\n✓ Completed! Loaded {total_loaded} documents into Elasticsearch.')
         )
+        self.stdout.write(f'Throughput: {format_throughput(total_loaded, elapsed)}')
     
-    def load_file(self, filepath, es_service, embedding_service, source, max_docs):
+    def load_files_parallel(self, data_path, files, source, workers, max_docs, batch_size, resume, reindex=False):
         """
-        Load a single JSONL.GZ file
+        Load files across a process pool and aggregate per-file stats
         """
-        self.stdout.write(f'Loading file: {os.path.basename(filepath)}')
+        self.stdout.write(f'Loading {len(files)} files with {workers} workers...')
         
-        loaded_count = 0
+        filepaths = [os.path.join(data_path, filename) for filename in files]
+        total_loaded = 0
+        total_errors = 0
         
-        try:
-            with gzip.open(filepath, 'rt', encoding='utf-8') as f:
-                for line in f:
-                    if loaded_count >= max_docs:
-                        break
-                    
-                    try:
-                        data = json.loads(line)
-                        
-                        # Extract fields
-                        title = data.get('title', '')
-                        content = data.get('content', data.get('text', ''))
-                        
-                        if not title or not content:
-                            continue
-                        
-                        # Generate embedding
-                        text_for_embedding = f"{title} {content[:500]}"
-                        embedding = embedding_service.embed_text(text_for_embedding)
-                        
-                        # Create document
-                        doc_id = f"news_{loaded_count}_{hash(title) % 1000000}"
-                        
-                        doc = {
-                            'title': title,
-                            'text': content[:1000],  # Limit content size
-                            'embedding': embedding,
-                            'source': source.id,
-                            'timestamp': data.get('date', data.get('published_at', '')),
-                            'metadata': {
-                                'category': data.get('category', ''),
-                                'source_name': source.name
-                            }
-                        }
-                        
-                        # Index to Elasticsearch
-                        es_service.index_document(settings.ES_INDEX_NEWS, doc_id, doc)
-                        
-                        # Save to database
-                        Document.objects.update_or_create(
-                            elasticsearch_id=doc_id,
-                            defaults={
-                                'source': source,
-                                'title': title,
-                                'content': content[:1000],
-                                'metadata': doc['metadata']
-                            }
-                        )
-                        
-                        loaded_count += 1
-                        
-                        if loaded_count % 10 == 0:
-                            self.stdout.write(f'  → Loaded {loaded_count} documents...')
-                    
-                    except json.JSONDecodeError:
-                        continue
-                    except Exception as e:
-                        self.stdout.write(self.style.WARNING(f'  Error processing document: {str(e)}'))
-                        continue
+        for stats in ingest_files_parallel(
+            filepaths, source, workers, max_docs, batch_size=batch_size, resume=resume, reindex=reindex
+        ):
+            total_loaded += stats['loaded']
+            total_errors += stats['errors']
+            
+            name = os.path.basename(stats['file'])
+            if 'error' in stats:
+                self.stdout.write(self.style.ERROR(f"  ✗ {name}: {stats['error']}"))
+            else:
+                self.stdout.write(
+                    f"  → {name}: {format_throughput(stats['loaded'], stats['elapsed'])}, "
+                    f"{stats['skipped']} unchanged, {stats['errors']} errors"
+                )
         
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f'Error loading file: {str(e)}'))
+        if total_errors:
+            self.stdout.write(self.style.WARNING(f'{total_errors} documents failed'))
         
-        return loaded_count
+        return total_loaded
     
-    def create_sample_data(self, es_service, embedding_service, source):
+    def load_file(self, filepath, ingestor, budget):
+        """
+        Stream a single JSONL.GZ file through the batched pipeline
+        """
+        self.stdout.write(f'Loading file: {os.path.basename(filepath)}')
+        
+        stats = ingestor.ingest_file(
+            filepath,
+            budget=budget,
+            on_batch=lambda loaded: self.stdout.write(f'  → Loaded {loaded} documents...')
+        )
+        
+        if stats['skipped']:
+            self.stdout.write(f"  {stats['skipped']} unchanged documents skipped")
+        if stats['errors']:
+            self.stdout.write(self.style.WARNING(f"  {stats['errors']} documents failed"))
+        
+        return stats['loaded']
+    
+    def create_sample_data(self, es_service, embedding_service, source, vector_store):
         """
         Create sample documents when no data files exist
         """
@@ -209,6 +242,10 @@ class Command(BaseCommand):
                 }
             }
             
+            if not vector_store.indexes_text:
+                vector_store.upsert([dict(doc, id=doc_id)])
+                doc = {k: v for k, v in doc.items() if k != 'embedding'}
+            
             es_service.index_document(settings.ES_INDEX_NEWS, doc_id, doc)
             
             Document.objects.update_or_create(
@@ -221,8 +258,5 @@ class Command(BaseCommand):
                 }
             )
         
+        vector_store.build_index()
         self.stdout.write(self.style.SUCCESS(f'✓ Created {len(sample_docs)} sample documents'))
-
-
-from django.utils import timezone
-
@@ -0,0 +1,54 @@
+"""
+Management command to run the shared embedding server
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from sources.embedding_server import EmbeddingServer
+
+
+class Command(BaseCommand):
+    help = 'Serve embeddings for all workers from one model over a Unix socket'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--socket',
+            type=str,
+            default=settings.EMBEDDING_SERVER_SOCKET,
+            help='Unix socket path (default: EMBEDDING_SERVER_SOCKET)',
+        )
+        parser.add_argument(
+            '--max-batch-size',
+            type=int,
+            default=settings.EMBEDDING_SERVER_MAX_BATCH_SIZE,
+            help='Maximum number of texts encoded together',
+        )
+        parser.add_argument(
+            '--max-wait-ms',
+            type=int,
+            default=settings.EMBEDDING_SERVER_MAX_WAIT_MS,
+            help='Maximum time to wait for a batch to fill up',
+        )
+
+    def handle(self, *args, **options):
+        socket_path = options['socket']
+        if not socket_path:
+            raise CommandError('No socket path given. Set EMBEDDING_SERVER_SOCKET or pass --socket.')
+        
+        server = EmbeddingServer(
+            socket_path,
+            max_batch_size=options['max_batch_size'],
+            max_wait_ms=options['max_wait_ms']
+        )
+        
+        # Load the model before accepting connections
+        server.batcher.embedding_service.load_model()
+        
+        self.stdout.write(self.style.SUCCESS(f'✓ Embedding server listening on {socket_path}'))
+        
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            self.stdout.write('Shutting down embedding server...')
+        finally:
+            server.server_close()
@@ -95,3 +95,20 @@ class UploadedFile(models.Model):
         db_table = 'uploaded_files'
         ordering = ['-created_at']
 
+
+class IngestionCheckpoint(models.Model):
+    """
+    Tracks how far a news file has been ingested so loads can resume
+    """
+    source = models.ForeignKey(DataSource, on_delete=models.CASCADE, related_name='ingestion_checkpoints')
+    file_path = models.CharField(max_length=500, unique=True)
+    file_size = models.BigIntegerField(default=0)
+    line_number = models.IntegerField(default=0)  # Lines consumed so far
+    completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.file_path} @ line {self.line_number}"
+
+    class Meta:
+        db_table = 'ingestion_checkpoints'
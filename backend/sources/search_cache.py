@@ -0,0 +1,150 @@
+"""
+Cache of Elasticsearch search results with index-generation invalidation
+"""
+
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+import hashlib
+import logging
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+GENERATION_KEY = 'es_index_generation:{}'
+
+
+def query_hash(*parts):
+    """
+    Stable digest of query text and vectors
+    """
+    digest = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, str):
+            digest.update(part.encode('utf-8'))
+        else:
+            digest.update(np.asarray(part, dtype=np.float32).tobytes())
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class SearchResultCache:
+    """
+    Process-local TTL/LRU cache of search hits
+
+    Keys include the index generation: the timestamp of the last write
+    to the index, kept in Django's cache. Writing to an index therefore
+    orphans all of its cached results. Writes made by other processes,
+    such as load_news, are only seen when that cache is shared (Redis);
+    with the default per-process cache they go unnoticed until the TTL.
+    Results fetched within one refresh interval of a write are not
+    cached, as they may not include it yet.
+
+    If Django's cache is unreachable the generation is None and searches
+    bypass this cache rather than fail.
+    """
+
+    REFRESH_INTERVAL = 1.0  # Seconds, Elasticsearch's default
+
+    def __init__(self, max_entries=1000, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _new_generation():
+        return time.time_ns()
+
+    def generation(self, index_name):
+        """
+        Current generation of an index, or None if the cache backend fails
+        """
+        try:
+            return cache.get_or_set(GENERATION_KEY.format(index_name), self._new_generation, timeout=None)
+        except Exception as e:
+            logger.warning(f"Search cache unavailable, bypassing it: {str(e)}")
+            return None
+
+    async def ageneration(self, index_name):
+        try:
+            return await cache.aget_or_set(GENERATION_KEY.format(index_name), self._new_generation, timeout=None)
+        except Exception as e:
+            logger.warning(f"Search cache unavailable, bypassing it: {str(e)}")
+            return None
+
+    def bump_generation(self, index_name):
+        """
+        Invalidate every cached result for an index
+
+        If the cache backend fails, at least this process drops its entries.
+        """
+        try:
+            cache.set(GENERATION_KEY.format(index_name), self._new_generation(), timeout=None)
+        except Exception as e:
+            logger.warning(f"Could not bump search cache generation for {index_name}: {str(e)}")
+            with self._lock:
+                self._entries.clear()
+
+    @staticmethod
+    def make_key(index_name, query_type, digest, size, generation):
+        return (index_name, query_type, digest, size, generation)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(entry[1])
+
+    def put(self, key, hits):
+        generation = key[-1]
+        if (time.time_ns() - generation) / 1e9 < self.REFRESH_INTERVAL:
+            return
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, list(hits))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        """
+        Hit/miss and eviction counters
+        """
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'entries': len(self._entries),
+            'evictions': self.evictions,
+        }
+
+
+# Singleton instance, shared by the sync and async services
+_search_cache = None
+
+def get_search_cache():
+    """
+    Get the search result cache, or None when disabled
+    """
+    global _search_cache
+    if _search_cache is None and settings.SEARCH_CACHE_ENABLED:
+        _search_cache = SearchResultCache(
+            max_entries=settings.SEARCH_CACHE_SIZE,
+            ttl=settings.SEARCH_CACHE_TTL
+        )
+    return _search_cache
@@ -1,6 +1,42 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.core.cache import cache
 from django.contrib.auth.models import User
-from .models import DataSource, Document, UploadedFile
+from unittest.mock import MagicMock, patch
+from asgiref.sync import async_to_sync
+from core import es_client
+from core.es_client import get_async_es_client, get_es_client
+from .models import DataSource, Document, IngestionCheckpoint, UploadedFile
+from .embedding_cache import DiskEmbeddingStore, EmbeddingCache
+from .embedding_server import EmbeddingServer, RemoteEmbeddingService
+from .chunking import chunk_text, iter_paragraphs
+from .elasticsearch_service import ElasticsearchService, collapse_to_parents, reciprocal_rank_fusion
+from .embedding_service import EmbeddingService
+from .search_cache import SearchResultCache
+from .vector_store import ElasticsearchVectorStore, LocalVectorStore, MilvusVectorStore
+from .ingestion import DocBudget, NewsIngestor, batched, content_hash, iter_news_articles
+from .management.commands.load_news import Command as LoadNewsCommand
+from concurrent.futures import Future
+from io import StringIO
+import gc
+import gzip
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import threading
+import types
+import weakref
+import numpy as np
+
+
+def _fake_embedding_service():
+    """
+    Embedding service mock returning a constant 2-d vector per text
+    """
+    embedding_service = MagicMock()
+    embedding_service.embed_batch_array.side_effect = lambda texts, **kwargs: np.full((len(texts), 2), 0.1, dtype=np.float32)
+    return embedding_service
 
 
 class SourcesTestCase(TestCase):
@@ -30,3 +66,731 @@ class SourcesTestCase(TestCase):
         self.assertEqual(doc.title, 'Test Document')
         self.assertEqual(doc.source, self.source)
 
+
+class NewsIngestionTestCase(TestCase):
+    def setUp(self):
+        self.source = DataSource.objects.create(
+            id='news-feed',
+            name='News Feed',
+            connector_type='news',
+            status='connected'
+        )
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.filepath = os.path.join(self.tmpdir.name, 'news.jsonl.gz')
+        with gzip.open(self.filepath, 'wt', encoding='utf-8') as f:
+            for i in range(5):
+                f.write(json.dumps({'title': f'Title {i}', 'content': f'Content {i}'}) + '\n')
+            f.write('not json\n')
+            f.write(json.dumps({'title': 'No content'}) + '\n')
+        self.embedding_service = _fake_embedding_service()
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def test_batched(self):
+        self.assertEqual(list(batched(range(5), 2)), [[0, 1], [2, 3], [4]])
+    
+    def test_iter_news_articles_skips_invalid_lines(self):
+        articles = list(iter_news_articles(self.filepath))
+        self.assertEqual(len(articles), 5)
+        self.assertEqual(articles[0]['title'], 'Title 0')
+    
+    def test_ingest_file_in_batches(self):
+        es_service = MagicMock()
+        
+        ingestor = NewsIngestor(es_service, self.embedding_service, self.source, index_name='test', batch_size=2)
+        stats = ingestor.ingest_file(self.filepath, max_docs=4)
+        
+        self.assertEqual(stats['loaded'], 4)
+        self.assertEqual(self.embedding_service.embed_batch_array.call_count, 2)
+        self.assertEqual(es_service.bulk_index.call_count, 2)
+        self.assertEqual(Document.objects.filter(source=self.source).count(), 4)
+    
+    def test_chunk_text_overlaps_whole_sentences(self):
+        text = 'One two three. Four five six. Seven eight nine. Ten eleven twelve.'
+        
+        chunks = chunk_text(text, max_words=6, overlap_words=3)
+        
+        self.assertEqual(chunks, [
+            'One two three. Four five six.',
+            'Four five six. Seven eight nine.',
+            'Seven eight nine. Ten eleven twelve.',
+        ])
+        self.assertEqual(chunk_text(' '.join(['word'] * 10) + '.', max_words=4, overlap_words=0)[-1], 'word word.')
+    
+    def test_iter_paragraphs_is_lazy_and_bounded(self):
+        lines = iter(['First line\n', 'of a paragraph\n', '\n', 'short\n', '\n', '\n', 'x' * 30 + '\n', 'y' * 30 + '\n'])
+        
+        paragraphs = iter_paragraphs(lines, min_length=10, max_length=40)
+        
+        self.assertEqual(next(paragraphs), 'First line of a paragraph')
+        self.assertEqual(list(lines), ['short\n', '\n', '\n', 'x' * 30 + '\n', 'y' * 30 + '\n'])
+        
+        lines = ['First line\n', '\n', 'short\n', '\n', 'x' * 30 + '\n', 'y' * 30 + '\n']
+        self.assertEqual(list(iter_paragraphs(lines, min_length=5, max_length=40)), ['First line', 'x' * 30 + ' ' + 'y' * 9])
+    
+    def test_articles_are_indexed_as_chunks(self):
+        es_service = MagicMock()
+        article = {
+            'title': 'Long article',
+            'content': 'First sentence here. Second sentence here. Third sentence here.',
+            'timestamp': '',
+            'category': 'retail',
+            'line_number': 1,
+        }
+        
+        ingestor = NewsIngestor(
+            es_service, self.embedding_service, self.source, index_name='test',
+            chunk_words=6, chunk_overlap_words=0
+        )
+        self.assertEqual(ingestor.ingest_batch([article]), 1)
+        
+        docs = es_service.bulk_index.call_args[0][1]
+        parent_id = ingestor.document_id(article)
+        self.assertEqual([doc['id'] for doc in docs], [f'{parent_id}_c0', f'{parent_id}_c1'])
+        self.assertEqual({doc['parent_id'] for doc in docs}, {parent_id})
+        self.assertEqual(Document.objects.get(elasticsearch_id=parent_id).content, article['content'])
+    
+    def test_external_vector_store_receives_embeddings(self):
+        es_service = MagicMock()
+        vector_store = MagicMock(indexes_text=False)
+        
+        ingestor = NewsIngestor(es_service, self.embedding_service, self.source, index_name='test', vector_store=vector_store)
+        ingestor.ingest_file(self.filepath)
+        
+        stored = vector_store.upsert.call_args[0][0]
+        indexed = es_service.bulk_index.call_args[0][1]
+        self.assertIn('embedding', stored[0])
+        self.assertNotIn('embedding', indexed[0])
+        self.assertEqual([doc['id'] for doc in stored], [doc['id'] for doc in indexed])
+    
+    def test_doc_budget_caps_ingestion(self):
+        budget = DocBudget(3)
+        self.assertEqual(budget.take(2), 2)
+        self.assertEqual(budget.take(2), 1)
+        self.assertTrue(budget.exhausted)
+        
+        es_service = MagicMock()
+        
+        ingestor = NewsIngestor(es_service, self.embedding_service, self.source, index_name='test', batch_size=2)
+        stats = ingestor.ingest_file(self.filepath, budget=DocBudget(3))
+        self.assertEqual(stats['loaded'], 3)
+    
+    def test_content_hash_is_stable(self):
+        self.assertEqual(content_hash('Title', 'Some  content'), content_hash('Title', 'Some content'))
+        self.assertNotEqual(content_hash('Title', 'Some content'), content_hash('Title', 'Other content'))
+    
+    def test_resume_skips_ingested_articles(self):
+        es_service = MagicMock()
+        
+        ingestor = NewsIngestor(es_service, self.embedding_service, self.source, index_name='test', batch_size=2)
+        ingestor.ingest_file(self.filepath, budget=DocBudget(3))
+        checkpoint = IngestionCheckpoint.objects.get()
+        self.assertEqual(checkpoint.line_number, 3)
+        self.assertFalse(checkpoint.completed)
+        
+        stats = ingestor.ingest_file(self.filepath)
+        self.assertEqual(stats['loaded'], 2)
+        self.assertTrue(IngestionCheckpoint.objects.get().completed)
+        
+        # A restart re-reads the file but skips unchanged articles before embedding
+        self.embedding_service.embed_batch_array.reset_mock()
+        restarted = NewsIngestor(es_service, self.embedding_service, self.source, index_name='test', resume=False)
+        stats = restarted.ingest_file(self.filepath)
+        self.assertEqual(stats['loaded'], 0)
+        self.assertEqual(stats['skipped'], 5)
+        self.embedding_service.embed_batch_array.assert_not_called()
+        
+        reindexed = NewsIngestor(es_service, self.embedding_service, self.source, index_name='test', reindex=True)
+        stats = reindexed.ingest_file(self.filepath)
+        self.assertEqual(stats['loaded'], 5)
+        self.assertEqual(Document.objects.filter(source=self.source).count(), 5)
+
+
+class _InlinePool:
+    """
+    Stands in for the process pool: each file runs in a freshly
+    initialized worker, all drawing from the same shared counter
+    """
+    
+    def __init__(self, max_workers, mp_context, initializer, initargs):
+        self.initializer = initializer
+        self.initargs = initargs
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        return False
+    
+    def submit(self, fn, *args):
+        future = Future()
+        self.initializer(*self.initargs)
+        future.set_result(fn(*args))
+        return future
+
+
+class ParallelIngestionTestCase(TestCase):
+    def setUp(self):
+        self.source = DataSource.objects.create(
+            id='news-feed',
+            name='News Feed',
+            connector_type='news',
+            status='connected'
+        )
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.files = []
+        for n in range(3):
+            filename = f'news_{n}.jsonl.gz'
+            with gzip.open(os.path.join(self.tmpdir.name, filename), 'wt', encoding='utf-8') as f:
+                for i in range(4):
+                    f.write(json.dumps({'title': f'Title {n}.{i}', 'content': f'Content {n}.{i}'}) + '\n')
+            self.files.append(filename)
+        
+        embedding_service = _fake_embedding_service()
+        for target, value in [
+            ('sources.ingestion_workers.ProcessPoolExecutor', _InlinePool),
+            ('sources.elasticsearch_service.ElasticsearchService', MagicMock()),
+            ('sources.embedding_service.EmbeddingService', MagicMock(return_value=embedding_service)),
+            ('sources.vector_store.get_vector_store', MagicMock()),
+        ]:
+            patcher = patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def load(self, max_docs, resume=True):
+        command = LoadNewsCommand(stdout=StringIO())
+        loaded = command.load_files_parallel(self.tmpdir.name, self.files, self.source, 2, max_docs, 2, resume)
+        return loaded, command.stdout.getvalue()
+    
+    def test_workers_share_budget_and_stats_are_aggregated(self):
+        loaded, output = self.load(max_docs=5)
+        
+        self.assertEqual(loaded, 5)
+        self.assertEqual(Document.objects.filter(source=self.source).count(), 5)
+        self.assertIn('news_0.jsonl.gz: 4 docs', output)
+        self.assertIn('news_1.jsonl.gz: 1 docs', output)
+        self.assertIn('news_2.jsonl.gz: 0 docs', output)
+        
+        # Unchanged documents are skipped without using up the budget
+        loaded, output = self.load(max_docs=5, resume=False)
+        
+        self.assertEqual(loaded, 5)
+        self.assertIn('news_0.jsonl.gz: 0 docs', output)
+        self.assertIn('4 unchanged', output)
+        self.assertEqual(Document.objects.filter(source=self.source).count(), 10)
+    
+    def test_unlimited_budget(self):
+        self.assertEqual(self.load(max_docs=None)[0], 12)
+
+
+class EmbeddingCacheTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def test_memory_lru_eviction(self):
+        cache = EmbeddingCache('model', max_entries=2)
+        cache.put_many(['a', 'b', 'c'], np.eye(3, dtype=np.float32))
+        
+        self.assertIsNone(cache.get_many(['a'])[0])
+        self.assertEqual(cache.get_many(['c  '])[0][2], 1.0)  # Whitespace-normalized
+        stats = cache.stats()
+        self.assertEqual(stats['memory_evictions'], 1)
+        self.assertEqual(stats['memory_hits'], 1)
+        self.assertEqual(stats['misses'], 1)
+    
+    def test_disk_store_persists_across_instances(self):
+        cache = EmbeddingCache('model', 10, self.tmpdir.name, dimension=3, capacity=2)
+        cache.put_many(['a', 'b', 'c'], np.eye(3, dtype=np.float32))
+        
+        reopened = EmbeddingCache('model', 10, self.tmpdir.name, dimension=3, capacity=2)
+        vectors = reopened.get_many(['a', 'b', 'c'])
+        self.assertIsNone(vectors[0])  # Evicted from the ring buffer
+        np.testing.assert_array_equal(vectors[2], [0, 0, 1])
+        self.assertEqual(reopened.stats()['disk_hits'], 2)
+        
+        other_model = EmbeddingCache('other-model', 10, self.tmpdir.name, dimension=3, capacity=2)
+        self.assertIsNone(other_model.get_many(['c'])[0])
+    
+    def test_disk_store_rejects_row_overwritten_during_read(self):
+        store = DiskEmbeddingStore(self.tmpdir.name, dimension=2, capacity=1)
+        other = DiskEmbeddingStore(self.tmpdir.name, dimension=2, capacity=1)
+        key_a, key_b = b'a' * 20, b'b' * 20
+        store.put_many([(key_a, np.array([1.0, 0.0]))])
+        
+        vectors = store._vectors
+        
+        class OverwrittenWhileCopying:
+            def __getitem__(self, row):
+                other.put_many([(key_b, np.array([0.0, 1.0]))])
+                return vectors[row]
+        
+        store._vectors = OverwrittenWhileCopying()
+        self.assertIsNone(store.get(key_a))
+        store._vectors = vectors
+        np.testing.assert_array_equal(store.get(key_b), [0.0, 1.0])
+    
+    def test_disk_store_resize_leaves_mapped_files_intact(self):
+        store = DiskEmbeddingStore(self.tmpdir.name, dimension=2, capacity=4)
+        store.put_many([(b'a' * 20, np.array([1.0, 0.0]))])
+        
+        resized = DiskEmbeddingStore(self.tmpdir.name, dimension=2, capacity=2)
+        
+        np.testing.assert_array_equal(store.get(b'a' * 20), [1.0, 0.0])
+        self.assertIsNone(resized.get(b'a' * 20))
+        self.assertEqual(len(DiskEmbeddingStore(self.tmpdir.name, dimension=2, capacity=2)), 0)
+    
+    def test_embedding_service_skips_model_on_hit(self):
+        with override_settings(EMBEDDING_CACHE_DIR=self.tmpdir.name, EMBEDDING_DIMENSION=3):
+            service = EmbeddingService()
+        
+        with patch.object(service, '_encode', side_effect=lambda texts, *args: np.ones((len(texts), 3), dtype=np.float32)) as encode:
+            service.embed_batch(['first', 'second'])
+            self.assertEqual(service.embed_text('first'), [1.0, 1.0, 1.0])
+            service.embed_batch(['second', 'third'])
+        
+        self.assertEqual([c.args[0] for c in encode.call_args_list], [['first', 'second'], ['third']])
+
+
+@override_settings(EMBEDDING_CACHE_ENABLED=False)
+class EmbeddingServerTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.socket_path = os.path.join(self.tmpdir.name, 'embeddings.sock')
+        self.backend = MagicMock()
+        self.backend.embed_batch_array.side_effect = lambda texts, **kwargs: np.array([[float(len(t)), 0.0] for t in texts], dtype=np.float32)
+        self.server = EmbeddingServer(self.socket_path, self.backend, max_batch_size=16, max_wait_ms=200)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmpdir.cleanup()
+    
+    def test_concurrent_requests_are_batched(self):
+        results = {}
+        
+        def query(text):
+            results[text] = RemoteEmbeddingService(self.socket_path).embed_text(text)
+        
+        threads = [threading.Thread(target=query, args=('x' * n,)) for n in range(1, 5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(results['xxx'], [3.0, 0.0])
+        self.assertLess(self.backend.embed_batch_array.call_count, 4)
+    
+    def test_falls_back_to_local_model(self):
+        service = RemoteEmbeddingService(os.path.join(self.tmpdir.name, 'missing.sock'))
+        with patch.object(EmbeddingService, '_encode', return_value=np.zeros((1, 2), dtype=np.float32)) as encode:
+            self.assertEqual(service.embed_text('hello'), [0.0, 0.0])
+        encode.assert_called_once()
+    
+    @override_settings(EMBEDDING_CACHE_ENABLED=True, EMBEDDING_CACHE_DIR='')
+    def test_only_the_server_caches(self):
+        self.assertIsNone(RemoteEmbeddingService(self.socket_path).cache)
+        self.assertIsNotNone(EmbeddingService().cache)
+
+
+@override_settings(EMBEDDING_CACHE_ENABLED=False, EMBEDDING_BACKEND='onnx')
+class EmbeddingBackendTestCase(TestCase):
+    def _service(self, onnx_output):
+        service = EmbeddingService()
+        models = {
+            'onnx': MagicMock(**{'encode.return_value': np.array(onnx_output, dtype=np.float32)}),
+            'torch': MagicMock(**{'encode.return_value': np.array([[1.0, 0.0], [0.0, 1.0]], dtype=np.float32)}),
+        }
+        service._load_transformer = lambda backend: models[backend]
+        return service
+    
+    def test_parity_within_tolerance(self):
+        result = self._service([[1.0, 0.01], [0.0, 2.0]]).check_backend_parity(['a', 'b'])
+        self.assertTrue(result['passed'])
+        self.assertGreater(result['min_cosine'], 0.99)
+    
+    def test_parity_outside_tolerance(self):
+        result = self._service([[1.0, 1.0], [0.0, 1.0]]).check_backend_parity(['a', 'b'])
+        self.assertFalse(result['passed'])
+    
+    def test_backends_use_separate_cache_namespaces(self):
+        with override_settings(EMBEDDING_BACKEND='torch'):
+            torch_namespace = EmbeddingService().cache_namespace
+        self.assertNotEqual(EmbeddingService().cache_namespace, torch_namespace)
+
+
+@override_settings(EMBEDDING_CACHE_ENABLED=False)
+class EmbeddingSimilarityTestCase(TestCase):
+    def setUp(self):
+        self.service = EmbeddingService()
+        self.candidates = np.array([[1.0, 0.0], [0.0, 2.0], [1.0, 1.0], [-1.0, 0.0]], dtype=np.float32)
+    
+    def test_similarity_matrix(self):
+        scores = self.service.similarity_matrix([[1.0, 0.0], [0.0, 1.0]], self.candidates)
+        self.assertEqual(scores.shape, (2, 4))
+        self.assertAlmostEqual(float(scores[1, 1]), 1.0, places=5)
+        self.assertAlmostEqual(self.service.similarity([2.0, 0.0], [1.0, 1.0]), 0.7071, places=4)
+    
+    def test_embed_batch_array_is_float32(self):
+        with patch.object(self.service, '_encode', return_value=np.ones((2, 3), dtype=np.float32)):
+            vectors = self.service.embed_batch_array(['a', 'b'])
+        self.assertEqual(vectors.dtype, np.float32)
+        self.assertEqual(vectors.shape, (2, 3))
+    
+    def test_es_serializes_embedding_arrays(self):
+        serializer = ElasticsearchService().es.transport.serializers.get_serializer('application/json')
+        body = serializer.dumps({'embedding': np.array([0.5, 1.0], dtype=np.float32)})
+        self.assertEqual(json.loads(body), {'embedding': [0.5, 1.0]})
+    
+    def test_es_client_is_shared(self):
+        self.assertIs(ElasticsearchService().es, get_es_client())
+        self.assertIs(ElasticsearchService().es, ElasticsearchService().es)
+    
+    def test_service_uses_new_client_after_fork(self):
+        service = ElasticsearchService()
+        parent_client = service.es
+        
+        es_client._reset_after_fork()
+        
+        self.assertIsNot(service.es, parent_client)
+        self.assertIs(service.es, get_es_client())
+    
+    def test_async_es_client_is_closed_with_its_loop(self):
+        async def client_ref():
+            client = get_async_es_client()
+            self.assertIs(get_async_es_client(), client)
+            return weakref.ref(client)
+        
+        first = async_to_sync(client_ref)()
+        second = async_to_sync(client_ref)()
+        gc.collect()
+        
+        self.assertIsNone(first())
+        self.assertIsNone(second())
+    
+    def test_top_k(self):
+        top = self.service.top_k([1.0, 0.1], self.candidates, k=2)
+        self.assertEqual([index for index, _ in top], [0, 2])
+        self.assertEqual(len(self.service.top_k([1.0, 0.0], self.candidates, k=10)), 4)
+
+
+class SearchResultCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.service = ElasticsearchService()
+        self.service.result_cache = SearchResultCache(max_entries=10, ttl=60)
+        self.service.es = MagicMock()
+        self.service.es.search.return_value = {'hits': {'hits': [{'_id': 'doc_1', '_score': 1.0}]}}
+    
+    @patch.object(SearchResultCache, 'REFRESH_INTERVAL', 0)
+    def test_repeated_query_is_served_from_cache(self):
+        vector = np.ones(4, dtype=np.float32)
+        
+        first = self.service.search_vector('news', vector, size=5)
+        second = self.service.search_vector('news', vector.copy(), size=5)
+        
+        self.assertEqual(first, second)
+        self.assertEqual(self.service.es.search.call_count, 1)
+        
+        self.service.search_vector('news', vector, size=10)
+        self.service.search_text('news', 'roas', size=5)
+        self.assertEqual(self.service.es.search.call_count, 3)
+    
+    @patch.object(SearchResultCache, 'REFRESH_INTERVAL', 0)
+    def test_writes_invalidate_index(self):
+        self.service.search_text('news', 'roas', size=5)
+        self.service.search_text('other', 'roas', size=5)
+        self.service.delete_document('news', 'doc_1')
+        
+        self.service.search_text('news', 'roas', size=5)
+        self.service.search_text('other', 'roas', size=5)
+        self.assertEqual(self.service.es.search.call_count, 3)
+    
+    def test_results_right_after_a_write_are_not_cached(self):
+        self.service.index_document('news', 'doc_1', {'title': 'ROAS'})
+        
+        self.service.search_text('news', 'roas', size=5)
+        self.service.search_text('news', 'roas', size=5)
+        self.assertEqual(self.service.es.search.call_count, 2)
+    
+    @patch.object(SearchResultCache, 'REFRESH_INTERVAL', 0)
+    def test_cache_backend_errors_bypass_the_cache(self):
+        with patch('sources.search_cache.cache') as backend:
+            backend.get_or_set.side_effect = ConnectionError('redis down')
+            backend.set.side_effect = ConnectionError('redis down')
+            
+            self.service.search_text('news', 'roas', size=5)
+            hits = self.service.search_text('news', 'roas', size=5)
+            self.service.delete_document('news', 'doc_1')
+        
+        self.assertEqual(hits, [{'_id': 'doc_1', '_score': 1.0}])
+        self.assertEqual(self.service.es.search.call_count, 2)
+        self.assertEqual(self.service.result_cache.stats()['entries'], 0)
+
+
+class HybridSearchTestCase(TestCase):
+    def hit(self, doc_id, source_id=None):
+        return {'_id': doc_id, '_score': 12.0, '_source': {'source_id': source_id} if source_id else {}}
+    
+    def test_reciprocal_rank_fusion(self):
+        text_hits = [self.hit('a'), self.hit('b'), self.hit('c')]
+        vector_hits = [self.hit('c'), self.hit('a'), self.hit('d')]
+        
+        fused = reciprocal_rank_fusion([text_hits, vector_hits], k=60, size=3)
+        
+        self.assertEqual([hit['_id'] for hit in fused], ['a', 'c', 'b'])
+        self.assertAlmostEqual(fused[0]['_score'], (1 / 61 + 1 / 62) / (2 / 61), places=5)
+        self.assertEqual(text_hits[0]['_score'], 12.0)
+    
+    def test_deduplicates_by_source_id(self):
+        text_hits = [self.hit('a1', 'a'), self.hit('a2', 'a'), self.hit('b1', 'b')]
+        
+        fused = reciprocal_rank_fusion([text_hits], size=5)
+        
+        self.assertEqual([hit['_id'] for hit in fused], ['a1', 'b1'])
+    
+    def test_collapse_chunks_to_parents(self):
+        hits = [
+            {'_id': 'a_c1', '_source': {'parent_id': 'a'}},
+            {'_id': 'b_c0', '_source': {'parent_id': 'b'}},
+            {'_id': 'a_c0', '_source': {'parent_id': 'a'}},
+            {'_id': 'legacy', '_source': {}},
+        ]
+        
+        self.assertEqual([hit['_id'] for hit in collapse_to_parents(hits)], ['a_c1', 'b_c0', 'legacy'])
+        self.assertEqual(len(collapse_to_parents(hits, size=1)), 1)
+    
+    def test_hybrid_search_survives_failed_retriever(self):
+        service = ElasticsearchService()
+        service.result_cache = None
+        service.search_text = MagicMock(return_value=[self.hit('a'), self.hit('b')])
+        service.search_vector = MagicMock(side_effect=RuntimeError('no embedding field'))
+        
+        fused = service.hybrid_search('news', 'roas', [0.1, 0.2], size=1)
+        
+        self.assertEqual([hit['_id'] for hit in fused], ['a'])
+        self.assertEqual(fused[0]['_score'], 1.0)
+        service.search_text.assert_called_once_with('news', 'roas', 4)
+
+
+class LocalVectorStoreTestCase(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+    
+    def tearDown(self):
+        self.tmpdir.cleanup()
+    
+    def test_search_returns_nearest_as_hits(self):
+        store = LocalVectorStore(self.tmpdir.name, dimension=2)
+        store.upsert([
+            {'id': 'east', 'embedding': [1.0, 0.0], 'text': 'East', 'parent_id': 'a'},
+            {'id': 'north', 'embedding': [0.0, 2.0], 'text': 'North'},
+            {'id': 'west', 'embedding': [-1.0, 0.0], 'text': 'West'},
+        ])
+        
+        hits = store.search([0.9, 0.1], size=2)
+        
+        self.assertEqual([hit['_id'] for hit in hits], ['east', 'north'])
+        self.assertEqual(hits[0]['_source'], {'text': 'East', 'parent_id': 'a'})
+        self.assertGreater(hits[0]['_score'], hits[1]['_score'])
+    
+    def test_search_batch_returns_one_hit_list_per_query(self):
+        store = LocalVectorStore(self.tmpdir.name, dimension=2)
+        store.upsert([
+            {'id': 'east', 'embedding': [1.0, 0.0], 'text': 'East'},
+            {'id': 'north', 'embedding': [0.0, 1.0], 'text': 'North'},
+        ])
+        
+        results = store.search_batch([[0.9, 0.1], [0.1, 0.9], [0.0, 0.0]], size=1)
+        
+        self.assertEqual([[hit['_id'] for hit in hits] for hits in results[:2]], [['east'], ['north']])
+        self.assertEqual(len(results), 3)
+    
+    @patch.object(LocalVectorStore, 'INITIAL_CAPACITY', 2)
+    def test_persists_updates_and_deletes(self):
+        store = LocalVectorStore(self.tmpdir.name, dimension=2)
+        store.upsert([{'id': str(i), 'embedding': [1.0, float(i)], 'text': f'v{i}'} for i in range(5)])
+        store.upsert([{'id': '0', 'embedding': [0.0, -1.0], 'text': 'moved'}])
+        store.delete(['1'])
+        
+        reopened = LocalVectorStore(self.tmpdir.name, dimension=2)
+        
+        self.assertEqual(reopened.count(), 4)
+        self.assertEqual(reopened.existing_ids(['0', '1', '9']), {'0'})
+        self.assertEqual(reopened.search([0.0, -1.0], size=1)[0]['_source']['text'], 'moved')
+        self.assertNotIn('1', [hit['_id'] for hit in reopened.search([1.0, 1.0], size=10)])
+    
+    @patch.object(LocalVectorStore, 'INITIAL_CAPACITY', 2)
+    def test_stores_sharing_a_directory_see_each_others_writes(self):
+        first = LocalVectorStore(self.tmpdir.name, dimension=2)
+        second = LocalVectorStore(self.tmpdir.name, dimension=2)
+        
+        first.upsert([{'id': 'a', 'embedding': [1.0, 0.0], 'text': 'A'}])
+        second.upsert([{'id': 'b', 'embedding': [0.0, 1.0], 'text': 'B'}])
+        second.upsert([{'id': str(i), 'embedding': [-1.0, float(i)], 'text': str(i)} for i in range(3)])
+        first.delete(['b'])
+        
+        self.assertEqual(first.search([1.0, 0.0], size=1)[0]['_source']['text'], 'A')
+        self.assertEqual(first.search([-1.0, 0.0], size=1)[0]['_id'], '0')
+        self.assertEqual(second.existing_ids(['a', 'b', '2']), {'a', '2'})
+        self.assertEqual(second.count(), 4)
+
+
+class ElasticsearchVectorStoreTestCase(TestCase):
+    def test_existing_ids_uses_mget(self):
+        es_service = MagicMock()
+        es_service.es.mget.side_effect = lambda index, ids, source: {
+            'docs': [{'_id': doc_id, 'found': doc_id != 'missing'} for doc_id in ids]
+        }
+        store = ElasticsearchVectorStore(es_service, 'news')
+        
+        self.assertEqual(store.existing_ids(['a', 'missing', 'b'], batch_size=2), {'a', 'b'})
+        self.assertEqual(es_service.es.mget.call_count, 2)
+
+
+class _FakeFieldSchema:
+    def __init__(self, name, dtype, is_primary=False, **params):
+        self.name = name
+        self.dtype = dtype
+        self.is_primary = is_primary
+        self.params = params
+
+
+class _FakeCollection:
+    """
+    In-memory stand-in for a pymilvus Collection
+    """
+    
+    def __init__(self, schema=None):
+        self.schema = schema
+        self.rows = {}
+        self.indexed = False
+        self.loaded = False
+    
+    @property
+    def num_entities(self):
+        return len(self.rows)
+    
+    def upsert(self, columns):
+        for doc_id, embedding, text, payload in zip(*columns):
+            self.rows[doc_id] = {'embedding': embedding, 'text': text, 'payload': payload}
+    
+    def flush(self):
+        pass
+    
+    def has_index(self):
+        return self.indexed
+    
+    def create_index(self, field, params):
+        self.indexed = True
+    
+    def load(self):
+        if not self.indexed:
+            raise RuntimeError('index not found')
+        self.loaded = True
+    
+    def query(self, expr, output_fields):
+        if not self.loaded:
+            raise RuntimeError('collection not loaded')
+        return [{'id': doc_id} for doc_id in self.rows if json.dumps(doc_id) in expr]
+
+
+class MilvusVectorStoreTestCase(TestCase):
+    def setUp(self):
+        pymilvus = types.ModuleType('pymilvus')
+        pymilvus.connections = MagicMock()
+        pymilvus.DataType = types.SimpleNamespace(INT64='INT64', VARCHAR='VARCHAR', FLOAT_VECTOR='FLOAT_VECTOR', JSON='JSON')
+        pymilvus.FieldSchema = _FakeFieldSchema
+        patcher = patch.dict(sys.modules, {'pymilvus': pymilvus})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        
+        self.store = MilvusVectorStore('test_segments')
+        self.store._collection = _FakeCollection()
+    
+    def test_incremental_upsert_skips_stored_ids(self):
+        self.store.upsert([
+            {'id': 'a', 'embedding': [1.0, 0.0], 'text': 'A', 'parent_id': 'p'},
+            {'id': 'b', 'embedding': [0.0, 1.0], 'text': 'B'},
+        ])
+        self.store.build_index()
+        
+        existing = self.store.existing_ids(['a', 'c'], batch_size=1)
+        self.store.upsert([{'id': 'c', 'embedding': [1.0, 1.0], 'text': 'C'}])
+        
+        self.assertEqual(existing, {'a'})
+        self.assertEqual(self.store.count(), 3)
+        self.assertEqual(self.store.collection.rows['a']['payload'], {'parent_id': 'p'})
+    
+    def test_existing_ids_does_not_build_index(self):
+        self.store.upsert([{'id': 'a', 'embedding': [1.0, 0.0], 'text': 'A'}])
+        
+        self.assertEqual(self.store.existing_ids(['a']), set())
+        self.assertFalse(self.store.collection.indexed)
+        self.assertFalse(self.store.collection.loaded)
+    
+    def test_check_schema_rejects_old_collection(self):
+        schema = types.SimpleNamespace(fields=self.store._fields(2), auto_id=False)
+        self.store._check_schema(_FakeCollection(schema), 2)
+        
+        old = types.SimpleNamespace(
+            fields=[
+                _FakeFieldSchema('id', 'INT64', is_primary=True),
+                _FakeFieldSchema('embedding', 'FLOAT_VECTOR', dim=2),
+                _FakeFieldSchema('text', 'VARCHAR', max_length=8192),
+            ],
+            auto_id=True
+        )
+        with self.assertRaises(ValueError):
+            self.store._check_schema(_FakeCollection(old), 2)
+        with self.assertRaises(ValueError):
+            self.store._check_schema(_FakeCollection(schema), 3)
+
+
+def _load_milvus_utils():
+    path = os.path.join(os.path.dirname(__file__), '..', '..', 'common', 'utils', 'milvus_utils.py')
+    spec = importlib.util.spec_from_file_location('milvus_utils', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class MilvusSearcherTestCase(TestCase):
+    def setUp(self):
+        self.model = MagicMock()
+        self.model.encode.side_effect = lambda texts, **kwargs: np.array([[float(len(text)), 0.0] for text in texts])
+        self.store = MagicMock()
+        self.store.search_batch.side_effect = lambda vectors, size: [
+            [{'_id': f'hit-{int(vector[0])}', '_score': 0.9, '_source': {'text': f'len {int(vector[0])}'}}]
+            for vector in vectors
+        ]
+        self.searcher = _load_milvus_utils().MilvusSearcher(self.model, self.store, batch_size=8)
+    
+    def test_queries_are_encoded_and_searched_in_one_batch(self):
+        response = self.searcher.search(['a', 'abc', 'ab'], top_k=1)
+        
+        self.store.load.assert_called_once()
+        self.model.encode.assert_called_once_with(['a', 'abc', 'ab'], batch_size=8, show_progress_bar=False)
+        self.store.search_batch.assert_called_once()
+        self.assertEqual([result['query'] for result in response['results']], ['a', 'abc', 'ab'])
+        self.assertEqual(
+            [result['hits'] for result in response['results']],
+            [
+                [{'id': 'hit-1', 'text': 'len 1', 'score': 0.9}],
+                [{'id': 'hit-3', 'text': 'len 3', 'score': 0.9}],
+                [{'id': 'hit-2', 'text': 'len 2', 'score': 0.9}],
+            ]
+        )
+        self.assertEqual(set(response['latency_ms']), {'encode', 'search', 'total'})
+    
+    def test_single_query_string(self):
+        response = self.searcher.search('abcd', top_k=1)
+        
+        self.assertEqual(response['results'][0]['hits'][0]['id'], 'hit-4')
@@ -0,0 +1,530 @@
+"""
+Vector store backends behind a common interface
+
+Implementations: Elasticsearch dense vectors, Milvus, and a local
+in-process store persisted to memory-mapped files.
+
+This module must not import Django at import time, so the standalone
+Milvus pipeline in common/utils can use it.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import numpy as np
+from sources.embedding_cache import FileLock
+
+logger = logging.getLogger(__name__)
+
+
+class VectorStore:
+    """
+    Interface for storing and searching embeddings
+
+    Records are dicts with an 'id', an 'embedding' and any other fields,
+    which are returned as the hit's '_source'. Search results are shaped
+    like Elasticsearch hits: {'_id', '_score', '_source'}.
+    """
+
+    # Whether the store also serves full-text search over the records
+    indexes_text = False
+
+    def create(self, dimension):
+        """
+        Create the underlying collection if it does not exist
+        """
+        raise NotImplementedError
+
+    def upsert(self, records):
+        raise NotImplementedError
+
+    def search(self, query_vector, size=10):
+        raise NotImplementedError
+
+    def search_batch(self, query_vectors, size=10):
+        """
+        Search several query vectors, returning one hit list per query
+        """
+        return [self.search(query_vector, size) for query_vector in query_vectors]
+
+    async def asearch(self, query_vector, size=10):
+        """
+        Search without blocking the event loop
+        """
+        return await asyncio.to_thread(self.search, query_vector, size)
+
+    def delete(self, ids):
+        raise NotImplementedError
+
+    def existing_ids(self, ids):
+        """
+        Subset of ids already in the store
+        """
+        raise NotImplementedError
+
+    def build_index(self):
+        """
+        Build the ANN index after a bulk load, where the backend needs one
+        """
+
+    def count(self):
+        raise NotImplementedError
+
+
+class ElasticsearchVectorStore(VectorStore):
+    """
+    Vectors stored as dense_vector fields next to the indexed documents
+    """
+
+    indexes_text = True
+
+    def __init__(self, es_service, index_name):
+        self.es_service = es_service
+        self.index_name = index_name
+
+    def create(self, dimension):
+        self.es_service.create_index(self.index_name)
+
+    def upsert(self, records):
+        if records:
+            self.es_service.bulk_index(self.index_name, records)
+
+    def search(self, query_vector, size=10):
+        return self.es_service.search_vector(self.index_name, query_vector, size=size)
+
+    async def asearch(self, query_vector, size=10):
+        from sources.elasticsearch_service import get_async_elasticsearch_service
+        return await get_async_elasticsearch_service().search_vector(self.index_name, query_vector, size=size)
+
+    def delete(self, ids):
+        for doc_id in ids:
+            self.es_service.delete_document(self.index_name, doc_id)
+
+    def existing_ids(self, ids, batch_size=1000):
+        """
+        Subset of ids already indexed, looked up with mget in batches
+        """
+        found = set()
+        for i in range(0, len(ids), batch_size):
+            response = self.es_service.es.mget(index=self.index_name, ids=ids[i:i + batch_size], source=False)
+            found.update(doc['_id'] for doc in response['docs'] if doc.get('found'))
+        return found
+
+    def count(self):
+        return self.es_service.es.count(index=self.index_name)['count']
+
+
+class MilvusVectorStore(VectorStore):
+    """
+    Milvus collection with a VARCHAR primary key
+
+    'text' is stored as its own field; every other record field goes into
+    a JSON 'payload' field.
+    """
+
+    def __init__(self, collection_name, host='127.0.0.1', port='19530', metric_type='IP',
+                 index_params=None, search_params=None, max_text_length=8192):
+        from pymilvus import connections
+
+        self.collection_name = collection_name
+        self.metric_type = metric_type
+        self.index_params = index_params or {
+            'metric_type': metric_type,
+            'index_type': 'IVF_FLAT',
+            'params': {'nlist': 1024}
+        }
+        self.search_params = search_params or {'metric_type': metric_type, 'params': {'nprobe': 8}}
+        self.max_text_length = max_text_length
+        self._collection = None
+        self._loaded = False
+
+        connections.connect('default', host=host, port=port)
+
+    @property
+    def collection(self):
+        if self._collection is None:
+            from pymilvus import Collection
+            self._collection = Collection(self.collection_name)
+        return self._collection
+
+    def _fields(self, dimension):
+        from pymilvus import DataType, FieldSchema
+
+        return [
+            FieldSchema(name='id', dtype=DataType.VARCHAR, is_primary=True, max_length=128),
+            FieldSchema(name='embedding', dtype=DataType.FLOAT_VECTOR, dim=dimension),
+            FieldSchema(name='text', dtype=DataType.VARCHAR, max_length=self.max_text_length),
+            FieldSchema(name='payload', dtype=DataType.JSON),
+        ]
+
+    @staticmethod
+    def _field_signature(field):
+        return (field.name, field.dtype, bool(field.is_primary), int(field.params.get('dim', 0)))
+
+    def _check_schema(self, collection, dimension):
+        """
+        Raise if an existing collection doesn't match this store's schema
+
+        Collections made by the old pipeline have an INT64 auto_id key and
+        no payload field, which upserts by content hash can't write to.
+        """
+        expected = [self._field_signature(field) for field in self._fields(dimension)]
+        actual = [self._field_signature(field) for field in collection.schema.fields]
+        if actual != expected or collection.schema.auto_id:
+            raise ValueError(
+                f"Milvus collection '{self.collection_name}' has an incompatible schema "
+                f"{[(name, str(dtype)) for name, dtype, _, _ in actual]}; recreate it with "
+                f"drop_existing=True (incremental=False in the Milvus pipeline)"
+            )
+
+    def create(self, dimension, drop_existing=False):
+        from pymilvus import Collection, CollectionSchema, utility
+
+        if utility.has_collection(self.collection_name):
+            if not drop_existing:
+                self._check_schema(self.collection, dimension)
+                return
+            logger.info(f"Dropping Milvus collection: {self.collection_name}")
+            utility.drop_collection(self.collection_name)
+
+        self._collection = Collection(name=self.collection_name, schema=CollectionSchema(self._fields(dimension)))
+        self._loaded = False
+        logger.info(f"Created Milvus collection: {self.collection_name}")
+
+    def _columns(self, records):
+        return [
+            [record['id'] for record in records],
+            np.asarray([record['embedding'] for record in records], dtype=np.float32),
+            [record.get('text', '')[:self.max_text_length // 3] for record in records],  # Up to 3 bytes per char
+            [
+                {k: v for k, v in record.items() if k not in ('id', 'embedding', 'text')}
+                for record in records
+            ],
+        ]
+
+    def upsert(self, records):
+        if records:
+            self.collection.upsert(self._columns(records))
+
+    def build_index(self):
+        """
+        Flush and create the index if missing
+
+        Call once after a bulk load rather than per batch. Once the index
+        exists, Milvus indexes newly sealed segments by itself.
+        """
+        self.collection.flush()
+        if not self.collection.has_index():
+            self.collection.create_index('embedding', self.index_params)
+            logger.info(f"Created index on {self.collection_name}.embedding")
+
+    def load(self):
+        """
+        Load the collection into memory, once per store
+        """
+        if not self._loaded:
+            self.collection.load()
+            self._loaded = True
+
+    def search(self, query_vector, size=10):
+        return self.search_batch([query_vector], size)[0]
+
+    def search_batch(self, query_vectors, size=10):
+        self.load()
+        results = self.collection.search(
+            data=np.atleast_2d(np.asarray(query_vectors, dtype=np.float32)),
+            anns_field='embedding',
+            param=self.search_params,
+            limit=size,
+            output_fields=['text', 'payload'],
+        )
+        return [
+            [
+                {
+                    '_id': hit.id,
+                    '_score': float(hit.distance),
+                    '_source': dict(hit.entity.get('payload') or {}, text=hit.entity.get('text')),
+                }
+                for hit in hits
+            ]
+            for hits in results
+        ]
+
+    @staticmethod
+    def _id_expr(ids):
+        return f"id in [{', '.join(json.dumps(doc_id) for doc_id in ids)}]"
+
+    def delete(self, ids):
+        if ids:
+            self.collection.delete(self._id_expr(ids))
+
+    def existing_ids(self, ids, batch_size=1000):
+        """
+        Subset of ids already in the collection, queried in batches
+
+        Milvus only queries loaded collections, and loading needs an index.
+        Until build_index() has run, nothing is reported as stored, so a
+        bulk load keeps its single deferred index build; rows left by an
+        interrupted load are re-embedded and upserted over themselves.
+        """
+        if not ids or not self.collection.has_index():
+            return set()
+        self.load()
+
+        found = set()
+        for i in range(0, len(ids), batch_size):
+            rows = self.collection.query(expr=self._id_expr(ids[i:i + batch_size]), output_fields=['id'])
+            found.update(row['id'] for row in rows)
+        return found
+
+    def all_ids(self, batch_size=1000):
+        """
+        Every ID in the collection
+        """
+        if not self.collection.has_index():
+            self.build_index()
+        self.load()
+
+        ids = set()
+        iterator = self.collection.query_iterator(batch_size=batch_size, expr='id != ""', output_fields=['id'])
+        while True:
+            rows = iterator.next()
+            if not rows:
+                iterator.close()
+                return ids
+            ids.update(row['id'] for row in rows)
+
+    def count(self):
+        return self.collection.num_entities
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process exact search over a memory-mapped float32 matrix
+
+    Vectors are normalized on write, so a search is one matrix-vector
+    product over the live rows, which stays in the low milliseconds for
+    the few hundred thousand vectors of a small deployment. Payloads are
+    kept in an append-only JSONL log; the latest line for an ID wins.
+
+    Several processes may share a directory: writers allocate rows under
+    an exclusive file lock after catching up with the log, and every
+    process applies log lines written by the others before it reads.
+    """
+
+    INITIAL_CAPACITY = 1024
+
+    def __init__(self, directory, dimension):
+        self.directory = directory
+        self.dimension = dimension
+        self._lock = threading.Lock()
+        self._rows = {}  # id -> row
+        self._ids = []  # row -> id
+        self._payloads = []  # row -> payload
+        self._alive = np.zeros(0, dtype=bool)
+        self._vectors = None
+        self._log_offset = 0  # Bytes of the log applied so far
+
+        os.makedirs(directory, exist_ok=True)
+        self._vectors_path = os.path.join(directory, 'vectors.f32')
+        self._log_path = os.path.join(directory, 'records.jsonl')
+        self._lock_path = os.path.join(directory, 'store.lock')
+
+        with self._lock, FileLock(self._lock_path):
+            self._map(self._file_capacity())
+            self._refresh()
+
+    def _file_capacity(self):
+        capacity = self.INITIAL_CAPACITY
+        if os.path.exists(self._vectors_path):
+            capacity = max(capacity, os.path.getsize(self._vectors_path) // (4 * self.dimension))
+        return capacity
+
+    def _refresh(self):
+        """
+        Apply log lines appended since the last refresh, possibly by other processes
+
+        Writers flush vectors before logging them, so every logged row is
+        readable. A partly written last line is left for the next refresh.
+        """
+        try:
+            size = os.path.getsize(self._log_path)
+        except FileNotFoundError:
+            return
+        if size <= self._log_offset:
+            return
+
+        with open(self._log_path, 'rb') as f:
+            f.seek(self._log_offset)
+            data = f.read(size - self._log_offset)
+        end = data.rfind(b'\n') + 1
+        entries = [json.loads(line) for line in data[:end].splitlines() if line]
+        self._log_offset += end
+
+        last_row = max((entry['row'] for entry in entries if entry.get('row') is not None), default=-1)
+        if last_row >= self._vectors.shape[0]:
+            self._map(max(last_row + 1, self._file_capacity()))
+
+        for entry in entries:
+            self._apply(entry['id'], entry.get('row'), entry.get('source'))
+
+    def _map(self, capacity):
+        """
+        Memory-map the vector file, growing it to capacity rows
+        """
+        size = capacity * self.dimension * 4
+        with open(self._vectors_path, 'ab') as f:
+            if f.tell() < size:
+                f.truncate(size)
+        self._vectors = np.memmap(self._vectors_path, dtype=np.float32, mode='r+', shape=(capacity, self.dimension))
+        alive = np.zeros(capacity, dtype=bool)
+        alive[:len(self._alive)] = self._alive
+        self._alive = alive
+
+    def _apply(self, doc_id, row, source):
+        if row is None:  # Deletion
+            old = self._rows.pop(doc_id, None)
+            if old is not None:
+                self._alive[old] = False
+                self._payloads[old] = None
+            return
+
+        while len(self._ids) <= row:
+            self._ids.append(None)
+            self._payloads.append(None)
+        self._rows[doc_id] = row
+        self._ids[row] = doc_id
+        self._payloads[row] = source
+        self._alive[row] = True
+
+    def _append_log(self, entries):
+        """
+        Append entries already applied here, under the file lock
+        """
+        with open(self._log_path, 'ab') as f:
+            f.write(''.join(json.dumps(entry, default=str) + '\n' for entry in entries).encode('utf-8'))
+            self._log_offset = f.tell()
+
+    def create(self, dimension):
+        if dimension != self.dimension:
+            raise ValueError(f"Store dimension is {self.dimension}, got {dimension}")
+
+    def upsert(self, records):
+        if not records:
+            return
+
+        vectors = np.asarray([record['embedding'] for record in records], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors /= norms
+
+        with self._lock, FileLock(self._lock_path):
+            # Catch up first so rows allocated by other writers are not reused
+            self._refresh()
+            entries = []
+            for record, vector in zip(records, vectors):
+                row = self._rows.get(record['id'], len(self._ids))
+                if row >= self._vectors.shape[0]:
+                    self._vectors.flush()
+                    self._map(self._vectors.shape[0] * 2)
+
+                source = {k: v for k, v in record.items() if k not in ('id', 'embedding')}
+                self._vectors[row] = vector
+                self._apply(record['id'], row, source)
+                entries.append({'id': record['id'], 'row': row, 'source': source})
+
+            self._vectors.flush()
+            self._append_log(entries)
+
+    def search(self, query_vector, size=10):
+        return self.search_batch([query_vector], size)[0]
+
+    def search_batch(self, query_vectors, size=10):
+        queries = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        queries = queries / norms
+
+        with self._lock:
+            self._refresh()
+            count = len(self._ids)
+            k = min(size, int(self._alive[:count].sum()))
+            if k <= 0:
+                return [[] for _ in queries]
+
+            scores = queries @ self._vectors[:count].T
+            scores[:, ~self._alive[:count]] = -np.inf
+
+            results = []
+            for row_scores in scores:
+                top = np.argpartition(-row_scores, k - 1)[:k]
+                top = top[np.argsort(-row_scores[top])]
+
+                # Cosine mapped to 0-1 like Elasticsearch's cosine similarity score
+                results.append([
+                    {
+                        '_id': self._ids[row],
+                        '_score': float((1.0 + row_scores[row]) / 2.0),
+                        '_source': dict(self._payloads[row]),
+                    }
+                    for row in top
+                ])
+            return results
+
+    def delete(self, ids):
+        with self._lock, FileLock(self._lock_path):
+            self._refresh()
+            entries = []
+            for doc_id in ids:
+                if doc_id in self._rows:
+                    self._apply(doc_id, None, None)
+                    entries.append({'id': doc_id})
+            if entries:
+                self._append_log(entries)
+
+    def existing_ids(self, ids):
+        with self._lock:
+            self._refresh()
+            return {doc_id for doc_id in ids if doc_id in self._rows}
+
+    def count(self):
+        with self._lock:
+            self._refresh()
+            return int(self._alive.sum())
+
+
+# One store per index or collection name
+_vector_stores = {}
+
+def get_vector_store(name=None):
+    """
+    Get the vector store configured by VECTOR_STORE_BACKEND
+
+    'elasticsearch' (default), 'milvus' or 'local'. The name is the index
+    or collection, defaulting to ES_INDEX_NEWS.
+    """
+    from django.conf import settings
+
+    name = name or settings.ES_INDEX_NEWS
+    store = _vector_stores.get(name)
+    if store is not None:
+        return store
+
+    backend = settings.VECTOR_STORE_BACKEND
+    if backend == 'elasticsearch':
+        from sources.elasticsearch_service import get_elasticsearch_service
+        store = ElasticsearchVectorStore(get_elasticsearch_service(), name)
+    elif backend == 'milvus':
+        store = MilvusVectorStore(name, host=settings.MILVUS_HOST, port=settings.MILVUS_PORT)
+    elif backend == 'local':
+        store = LocalVectorStore(
+            os.path.join(str(settings.VECTOR_STORE_LOCAL_DIR), name),
+            settings.EMBEDDING_DIMENSION
+        )
+    else:
+        raise ValueError(f"Unknown vector store backend: {backend}")
+
+    _vector_stores[name] = store
+    return store
@@ -1,7 +1,32 @@
-from pymilvus import connections, FieldSchema, CollectionSchema, DataType, Collection, utility
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from sentence_transformers import SentenceTransformer
-import re
+import hashlib
 import os
+import sys
+import time
+
+# Reuse the backend's vector store without setting up Django
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'backend'))
+from sources.chunking import iter_paragraphs  # noqa: E402
+from sources.vector_store import MilvusVectorStore  # noqa: E402
+
+
+def segment_id(text: str) -> str:
+    """
+    Content-hash primary key of a text segment
+    """
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+def _batched(iterable, batch_size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
 
 
 def milvus_text_embedding_pipeline(
@@ -11,30 +36,44 @@ def milvus_text_embedding_pipeline(
     model_name: str = "Qwen/Qwen3-Embedding-0.6B",
     text_file_path: str = "../data/sample_text.txt",
     max_length: int = 2048,
-    batch_size: int = 16
+    batch_size: int = 16,
+    incremental: bool = True,
+    insert_batch_size: int = 1000,
+    prune: bool = False,
+    streaming: bool = False,
+    max_pending_inserts: int = 2
 ):
     """
     Functional pipeline up to insertion (Steps 1–7):
         1. Connect to Milvus
         2. Load embedding model
-        3. Load text file
-        4. Generate embeddings
-        5. Create Milvus collection
-        6. Insert data
-        7. Create index
+        3. Segment text file into paragraphs, lazily
+        4. Create Milvus collection (dropped first unless incremental)
+        5. Find segments not yet stored, by content hash
+        6. Embed and insert them in batches of insert_batch_size
+        7. Create index, once, after all inserts
+
+    In incremental mode a refresh only embeds new or changed segments.
+    Superseded segments stay in the collection unless prune is set.
+
+    In streaming mode the file is processed one batch at a time, so memory
+    stays constant regardless of its size. Inserts run in the background
+    while the next batch is embedded; at most max_pending_inserts batches
+    wait for insertion before encoding blocks. Pruning in streaming mode
+    keeps the ids of all segments in memory.
 
     Returns
     -------
     model : SentenceTransformer
         Loaded embedding model (for reuse)
-    collection : Collection
-        Milvus collection object
+    store : MilvusVectorStore
+        Vector store wrapping the Milvus collection
     """
 
     # ---------------------------------------------------
     # 1️⃣ Connect to Milvus
     # ---------------------------------------------------
-    connections.connect("default", host=milvus_host, port=milvus_port)
+    store = MilvusVectorStore(collection_name, host=milvus_host, port=milvus_port, max_text_length=max_length * 3)
     print(f"✅ Connected to Milvus at {milvus_host}:{milvus_port}")
 
     # ---------------------------------------------------
@@ -44,106 +83,156 @@ def milvus_text_embedding_pipeline(
     print(f"✅ Loaded embedding model: {model_name}")
 
     # ---------------------------------------------------
-    # 3️⃣ Read text file
+    # 3️⃣ Segment text file (lazily, paragraph by paragraph)
     # ---------------------------------------------------
     if not os.path.exists(text_file_path):
         raise FileNotFoundError(f"❌ Text file not found: {text_file_path}")
 
     with open(text_file_path, "r", encoding="utf-8") as f:
-        text = " ".join(f.readlines())
-        docs = [line[:max_length] for line in re.split(r'\n\s*\n', text.strip()) if len(line.strip()) > 50]
-    print(f"📄 Loaded {len(docs)} text segments from {text_file_path}")
-
-    # ---------------------------------------------------
-    # 4️⃣ Generate embeddings
-    # ---------------------------------------------------
-    embeddings = model.encode(docs, batch_size=batch_size, show_progress_bar=True)
-    print(f"✅ Generated embeddings with shape: {embeddings.shape}")
-
-    # ---------------------------------------------------
-    # 5️⃣ Define or recreate collection
-    # ---------------------------------------------------
-    if utility.has_collection(collection_name):
-        print(f"⚠️ Collection '{collection_name}' exists. Dropping it...")
-        utility.drop_collection(collection_name)
-        print(f"🗑️ Collection '{collection_name}' dropped.")
-
-    fields = [
-        FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
-        FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=embeddings.shape[1]),
-        FieldSchema(name="text", dtype=DataType.VARCHAR, max_length=max_length * 3),
-    ]
-
-    schema = CollectionSchema(fields, description="Text embeddings using Qwen3 model")
-    collection = Collection(name=collection_name, schema=schema)
-    print(f"✅ Created Milvus collection: {collection_name}")
-
-    # ---------------------------------------------------
-    # 6️⃣ Insert embeddings + text
-    # ---------------------------------------------------
-    collection.insert([embeddings.tolist(), docs])
-    collection.flush()
-    print(f"✅ Inserted {len(docs)} records into '{collection_name}'")
-
-    # ---------------------------------------------------
-    # 7️⃣ Create index
-    # ---------------------------------------------------
-    index_params = {
-        "metric_type": "IP",
-        "index_type": "IVF_FLAT",
-        "params": {"nlist": 1024}
-    }
-    collection.create_index("embedding", index_params)
-    print("✅ Index created on 'embedding'")
+        docs = iter_paragraphs(f, min_length=50, max_length=max_length)
+        if not streaming:
+            docs = list(docs)
+            print(f"📄 Loaded {len(docs)} text segments from {text_file_path}")
+
+        # ---------------------------------------------------
+        # 4️⃣ Define or recreate collection
+        # ---------------------------------------------------
+        store.create(model.get_sentence_embedding_dimension(), drop_existing=not incremental)
+        print(f"✅ Milvus collection ready: {collection_name}")
+
+        # ---------------------------------------------------
+        # 5️⃣ 6️⃣ Skip stored segments, embed and insert the rest
+        # ---------------------------------------------------
+        seen_ids = set() if prune else None
+        batches = _batched(docs, insert_batch_size if streaming else len(docs) or 1)
+        pending = deque()
+        unchanged = inserted = 0
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            for batch in batches:
+                segments = {}
+                for doc in batch:
+                    segments.setdefault(segment_id(doc), doc)
+                if seen_ids is not None:
+                    seen_ids.update(segments)
+
+                existing = store.existing_ids(list(segments)) if incremental else set()
+                new_ids = [doc_id for doc_id in segments if doc_id not in existing]
+                unchanged += len(existing)
+
+                for ids in _batched(new_ids, insert_batch_size):
+                    texts = [segments[doc_id] for doc_id in ids]
+                    embeddings = model.encode(texts, batch_size=batch_size, show_progress_bar=False)
+
+                    # Backpressure: wait for the oldest insert when too many are queued
+                    while len(pending) >= max_pending_inserts:
+                        pending.popleft().result()
+                    pending.append(executor.submit(store.upsert, [
+                        {"id": doc_id, "text": text, "embedding": embedding}
+                        for doc_id, text, embedding in zip(ids, texts, embeddings)
+                    ]))
+                    inserted += len(ids)
+                    print(f"✅ Queued {inserted} new or changed records for '{collection_name}'")
+
+            while pending:
+                pending.popleft().result()
+
+    print(f"🔁 {unchanged} unchanged, {inserted} new or changed segments inserted")
+
+    if prune:
+        stale = list(store.all_ids() - seen_ids)
+        store.delete(stale)
+        print(f"🗑️ Removed {len(stale)} segments no longer in {text_file_path}")
+
+    # ---------------------------------------------------
+    # 7️⃣ Create index (no-op if it already exists)
+    # ---------------------------------------------------
+    store.build_index()
+    print("✅ Index ready on 'embedding'")
+
+    return model, store
+
+
+class MilvusSearcher:
+    """
+    Long-lived searcher over a Milvus collection (Steps 8–10)
 
-    return model, collection
+    Loads the collection once and serves batches of queries: the texts are
+    encoded together and sent as a single batched search. Keep one
+    instance per process and reuse it across requests.
+    """
 
+    def __init__(self, model: SentenceTransformer, store: MilvusVectorStore, batch_size: int = 32):
+        self.model = model
+        self.store = store
+        self.batch_size = batch_size
+
+        # ---------------------------------------------------
+        # 8️⃣ Load collection into memory (once)
+        # ---------------------------------------------------
+        self.store.load()
+
+    def search(self, query_texts, top_k: int = 5):
+        """
+        Search a batch of query texts
+
+        Returns a dict with 'results', one entry per query holding its
+        hits, and 'latency_ms' for the encode and search stages.
+        """
+        if isinstance(query_texts, str):
+            query_texts = [query_texts]
+        started = time.perf_counter()
+
+        # ---------------------------------------------------
+        # 9️⃣ Encode all queries together, then one batched search
+        # ---------------------------------------------------
+        embeddings = self.model.encode(list(query_texts), batch_size=self.batch_size, show_progress_bar=False)
+        encoded = time.perf_counter()
+
+        hit_lists = self.store.search_batch(embeddings, size=top_k) if len(query_texts) else []
+        searched = time.perf_counter()
+
+        return {
+            "results": [
+                {
+                    "query": query_text,
+                    "hits": [
+                        {"id": hit["_id"], "text": hit["_source"].get("text", ""), "score": hit["_score"]}
+                        for hit in hits
+                    ],
+                }
+                for query_text, hits in zip(query_texts, hit_lists)
+            ],
+            "latency_ms": {
+                "encode": (encoded - started) * 1000,
+                "search": (searched - encoded) * 1000,
+                "total": (searched - started) * 1000,
+            },
+        }
 
 
 # ---------------------------------------------------
-# 🔍 8️⃣ 9️⃣ 10️⃣ — Search & Display as separate function
+# 🔍 🔟 — Display results of a single query
 # ---------------------------------------------------
 def milvus_search_query(
     model: SentenceTransformer,
-    collection: Collection,
+    store: MilvusVectorStore,
     query_text: str,
     top_k: int = 5
 ):
     """
-    Handles search and results display (Steps 8–10):
-        8. Load collection into memory
-        9. Perform vector search
-        10. Display top results
-    """
+    Search a single query and print the top results
 
-    # ---------------------------------------------------
-    # 8️⃣ Load collection
-    # ---------------------------------------------------
-    collection.load()
-    print("✅ Collection loaded into memory")
-
-    print(f"📊 Total entities in collection: {collection.num_entities}")
-
-    # ---------------------------------------------------
-    # 9️⃣ Perform vector search
-    # ---------------------------------------------------
-    query_embedding = model.encode(query_text)
-    search_params = {"metric_type": "IP", "params": {"nprobe": 8}}
-
-    results = collection.search(
-        data=[query_embedding],
-        anns_field="embedding",
-        param=search_params,
-        limit=top_k,
-        output_fields=["text"],
-    )
+    For repeated queries, create a MilvusSearcher once and reuse it.
+    """
+    response = MilvusSearcher(model, store).search([query_text], top_k=top_k)
 
     # ---------------------------------------------------
     # 🔟 Display results
     # ---------------------------------------------------
     print(f"\n🔍 Top {top_k} results for query: '{query_text}'")
-    for hits in results:
-        for hit in hits:
-            print(f"➡ text: {hit.entity.get('text')}")
-            print(f"   similarity: {hit.distance:.4f}")
-            print("-" * 60)
+    for hit in response["results"][0]["hits"]:
+        print(f"➡ text: {hit['text']}")
+        print(f"   similarity: {hit['score']:.4f}")
+        print("-" * 60)
+    print(f"⏱️ encode {response['latency_ms']['encode']:.1f}ms, search {response['latency_ms']['search']:.1f}ms")